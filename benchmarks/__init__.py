@@ -0,0 +1,8 @@
+"""
+Offline benchmarks of the bot.
+
+The sites are replaced by the fixtures served by a local FlareSolverr
+stand-in and reddit by a stub, so nothing leaves the machine.
+
+    python -m benchmarks [-h]
+"""
@@ -0,0 +1,113 @@
+"""
+Runs the scenarios and prints the timings as JSON.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+
+from ffn_bot.cache import default_cache
+from ffn_bot.solver import default_client
+
+from benchmarks.fakesolver import FakeSolverr
+from benchmarks.scenarios import SCENARIOS
+
+
+class Environment(object):
+    """The fake services the scenarios run against."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.solver = FakeSolverr(latency=latency).start()
+        default_client.configure({"url": self.solver.url})
+        # The fixtures do not have to be protected from us.
+        default_cache.throttle = False
+
+    def close(self):
+        default_client.close()
+        self.solver.stop()
+
+
+def get_cli_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "-k", "--filter", default="",
+        help="only run scenarios containing this string")
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=5,
+        help="the number of timed runs of every scenario")
+    parser.add_argument(
+        "-l", "--latency", type=float, default=50,
+        help="the latency of the fake FlareSolverr in milliseconds")
+    parser.add_argument(
+        "-o", "--output",
+        help="also write the results to this file")
+    parser.add_argument(
+        "--list", action="store_true",
+        help="list the scenarios and exit")
+    return parser.parse_args()
+
+
+def run_scenario(factory, env, repeat):
+    prepare, run = factory(env)
+    timings = []
+    for _ in range(repeat):
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return {
+        "runs": timings,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "max": max(timings),
+    }
+
+
+def main():
+    args = get_cli_args()
+    names = [name for name in SCENARIOS if args.filter in name]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    env = Environment(args.latency / 1000)
+    results = {}
+    try:
+        for name in names:
+            print("Running {0}...".format(name), file=sys.stderr)
+            # Keep the output of the bot out of the results.
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = run_scenario(SCENARIOS[name], env, args.repeat)
+    finally:
+        env.close()
+
+    output = json.dumps({
+        "meta": {
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "latency_ms": args.latency,
+            "solver_requests": env.solver.requests,
+        },
+        "results": results,
+    }, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Benchmarks the memory used by loaded stories.
+
+Loads N fanfiction.net stories from a synthetic page with a long
+chapter and reports the peak RSS and the memory still held by the
+stories.
+
+    python benchmarks/bench_memory.py [stories] [chapter words]
+"""
+import gc
+import os
+import resource
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ffn_bot.cache import default_cache  # noqa: E402
+from ffn_bot.fetchers import registry  # noqa: E402
+
+PAGE = """<html><body>
+<div id="pre_story_links"><span><a href="/book/">Books</a> <a href="/book/hp/">Harry Potter</a></span></div>
+<div id="profile_top">
+<b>Story {id}</b> By: <a href="/u/{id}/author">Author {id}</a>
+<div>The summary of story {id}.</div>
+<span>Rated: Fiction T - English - Adventure/Drama - Harry P. - Chapters: 3 - Words: 12,345 -
+Reviews: 10 - Published: 1/1/2010 - Status: Complete - id: {id}</span>
+</div>
+<div role="a"><div class="storytext xcontrast_txt nocopy" id="storytext">{chapter}</div></div>
+</body></html>"""
+
+
+def main(count, words):
+    chapter = "<p>" + "word " * words + "</p>"
+    default_cache.get_page = lambda page, throttle=0, **kwargs: PAGE.format(
+        id=page.split("/s/")[1].split("/")[0], chapter=chapter)
+
+    site = registry.get("linkffn")
+    tracemalloc.start()
+    stories = [site.generate_response(site.id_link % i, set()) for i in range(count)]
+    for story in stories:
+        story.load()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # ru_maxrss is in kilobytes on linux.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("{0} stories with {1} words per chapter".format(count, words))
+    print("peak rss:            {0:>10.1f} MB".format(rss))
+    print("held by stories:     {0:>10.1f} KB".format(current / 1024))
+    print("per story:           {0:>10.1f} KB".format(current / 1024 / count))
+    print("peak while loading:  {0:>10.1f} MB".format(peak / 1024 / 1024))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [1000, 20000][len(args):]))
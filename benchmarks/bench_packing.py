@@ -0,0 +1,65 @@
+"""
+Benchmarks packing slim stories into replies.
+
+Compares the packer with the quadratic loop previously used by
+the slim replies.
+
+    python benchmarks/bench_packing.py [stories ...]
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ffn_bot.packing import pack  # noqa: E402
+
+LIMIT = 10000 - 60
+
+
+def make_stories(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(200, 1200)))
+        for _ in range(count)]
+
+
+def pack_quadratic(stories):
+    stories = list(stories)
+    replies = []
+    current_reply = []
+    while len(stories) != 0:
+        current_story = stories.pop(0)
+        if sum([len(story) for story in current_reply]) + len(current_story) > LIMIT:
+            replies.append("".join(current_reply))
+            current_reply = []
+        else:
+            current_reply += current_story
+    if len(current_reply) != 0:
+        replies.append("".join(current_reply))
+    return replies
+
+
+def pack_linear(stories):
+    return ["".join(chunk) for chunk in pack(stories, LIMIT)]
+
+
+def main(sizes):
+    print("{0:>8} {1:>14} {2:>14} {3:>8}".format("stories", "quadratic (s)", "linear (s)", "speedup"))
+    for size in sizes:
+        stories = make_stories(size)
+        number = max(1, 2000 // size)
+        old = min(timeit.repeat(lambda: pack_quadratic(stories), number=number, repeat=3)) / number
+        new = min(timeit.repeat(lambda: pack_linear(stories), number=number, repeat=3)) / number
+        print("{0:>8} {1:>14.6f} {2:>14.6f} {3:>7.1f}x".format(size, old, new, old / new))
+
+        # The linear packer does not lose the story that overflows.
+        packed = pack_linear(stories)
+        assert "".join(packed) == "".join(stories)
+        assert all(len(reply) <= LIMIT for reply in packed)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000])
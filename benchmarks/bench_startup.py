@@ -0,0 +1,64 @@
+"""
+Benchmarks the import time of the bot.
+
+Every module is imported in a fresh interpreter. The heavy
+dependencies that were imported on the way are listed as well,
+as the fetchers should only be loaded on their first request.
+
+    python benchmarks/bench_startup.py [module ...]
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+MODULES = (
+    "ffn_bot.fetchers",
+    "ffn_bot.parser",
+    "ffn_bot.commentparser",
+    "ffn_bot.reddit_bot",
+)
+
+HEAVY = ("lxml", "bs4", "cssselect", "requests", "googlesearch", "praw")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+    "fetchers": sorted(name for name in sys.modules if name.startswith("ffn_bot.fetchers."))
+}}))
+"""
+
+
+def measure(module, repeat=5):
+    results = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            cwd=ROOT)
+        results.append(json.loads(output.decode("utf-8").splitlines()[-1]))
+    best = min(results, key=lambda result: result["seconds"])
+    return best
+
+
+def main(modules):
+    for module in modules:
+        try:
+            result = measure(module)
+        except subprocess.CalledProcessError:
+            print("{0:<24} failed to import".format(module))
+            continue
+        print("{0:<24} {1:>8.1f} ms  deps: {2}  fetchers: {3}".format(
+            module, result["seconds"] * 1000,
+            ", ".join(result["loaded"]) or "-",
+            ", ".join(result["fetchers"]) or "-"))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or MODULES)
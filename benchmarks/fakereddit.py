@@ -0,0 +1,119 @@
+"""
+A stub of the parts of reddit the bot talks to.
+
+The objects subclass the praw models, so the bot recognizes them,
+but are never initialized by praw and never make a request.
+"""
+import itertools
+import time
+import types
+
+import praw.models
+
+_ids = itertools.count(1)
+
+
+def _new_id():
+    return "b{0:05d}".format(next(_ids))
+
+
+def redditor(name):
+    return types.SimpleNamespace(name=name)
+
+
+class _StubMixin(object):
+
+    def _init_stub(self, kind, **attributes):
+        # Bypass praws __setattr__, which would objectify the values.
+        self.__dict__.update(attributes)
+        self.__dict__["_fetched"] = True
+        self.__dict__["_stub_kind"] = kind
+        self.__dict__["sent"] = []
+
+    @property
+    def fullname(self):
+        return "{0}_{1}".format(self._stub_kind, self.id)
+
+    def reply(self, body):
+        reply = Comment(body, author=self.bot_name, parent=self, link_id=getattr(self, "link_id", None))
+        self.sent.append(reply)
+        return reply
+
+    def delete(self):
+        pass
+
+    def mark_read(self):
+        pass
+
+
+class Comment(_StubMixin, praw.models.Comment):
+
+    def __init__(self, body, author="reader", parent=None, link_id=None,
+                 replies=(), bot_name="FanfictionBot"):
+        id = _new_id()
+        self._init_stub(
+            "t1", id=id, body=body, author=redditor(author),
+            created_utc=time.time(), bot_name=bot_name,
+            link_id=link_id or "t3_" + _new_id(),
+            permalink="/r/bench/comments/x/y/" + id,
+            _parent=parent, _replies=list(replies))
+
+    @property
+    def replies(self):
+        return self._replies
+
+    @property
+    def submission(self):
+        return None
+
+    def parent(self):
+        return self._parent
+
+    def refresh(self):
+        return self
+
+
+class CommentForest(object):
+    """The loaded comments of a submission."""
+
+    def __init__(self, comments):
+        self.comments = list(comments)
+
+    def __iter__(self):
+        return iter(self.comments)
+
+    def list(self):
+        return list(self.comments)
+
+    def replace_more(self, limit=32):
+        return []
+
+
+class Submission(_StubMixin, praw.models.Submission):
+
+    def __init__(self, selftext, author="reader", subreddit="bench",
+                 comments=(), bot_name="FanfictionBot", id=None):
+        id = id or _new_id()
+        self._init_stub(
+            "t3", id=id, selftext=selftext, author=redditor(author),
+            created_utc=time.time(), bot_name=bot_name,
+            link_id="t3_" + id,
+            permalink="/r/{0}/comments/{1}/".format(subreddit, id),
+            subreddit=types.SimpleNamespace(display_name=subreddit),
+            _comments=CommentForest(comments))
+
+    @property
+    def comments(self):
+        return self._comments
+
+
+class Reddit(object):
+    """Answers the lookups the bot makes."""
+
+    def __init__(self, submissions=()):
+        self.submissions = {submission.fullname: submission for submission in submissions}
+        self.info_calls = 0
+
+    def info(self, fullnames):
+        self.info_calls += 1
+        return [self.submissions[name] for name in fullnames if name in self.submissions]
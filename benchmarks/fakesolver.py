@@ -0,0 +1,126 @@
+"""
+A local stand-in for FlareSolverr.
+
+Speaks the /v1 JSON protocol used by ffn_bot.solver and answers
+every request.get with the fixture of the requested site.
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# The fixture used for each domain.
+FIXTURE_BY_DOMAIN = (
+    ("fanfiction.net", "ffn.html"),
+    ("fictionpress.com", "fp.html"),
+    ("archiveofourown.org", "ao3.html"),
+    ("siye.co.uk", "siye.html"),
+    ("hpfanficarchive.com", "ffa.html"),
+    ("adult-fanfiction.org", "aff.html"),
+)
+
+
+def load_fixture(name):
+    """Returns the content of a fixture."""
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def fixture_for(url):
+    """Returns the name of the fixture of the url or None."""
+    domain = urlparse(url).netloc.lower()
+    for suffix, name in FIXTURE_BY_DOMAIN:
+        if domain == suffix or domain.endswith("." + suffix):
+            return name
+    return None
+
+
+class FakeSolverr(object):
+    """
+    Serves the fixtures on a local port.
+    """
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        """
+        :param latency:  Seconds every request.get takes.
+        :param host:     The address to listen on.
+        :param port:     The port to listen on. (0 picks a free one)
+        """
+        self.latency = latency
+        self.pages = {name: load_fixture(name) for _, name in FIXTURE_BY_DOMAIN}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{0}:{1}/v1".format(host, port)
+
+    def _handler(self):
+        solver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                params = json.loads(self.rfile.read(length).decode("utf-8"))
+                self._send(solver.command(params))
+
+            def _send(self, content):
+                data = json.dumps(content).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def command(self, params):
+        """Answers a single command."""
+        cmd = params.get("cmd")
+        if cmd in ("sessions.create", "sessions.destroy"):
+            return {"status": "ok", "message": "", "session": params.get("session")}
+        if cmd != "request.get":
+            return {"status": "error", "message": "Unknown command: {0}".format(cmd)}
+
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        name = fixture_for(params.get("url", ""))
+        if name is None:
+            return {"status": "error", "message": "No fixture for {0}".format(params.get("url"))}
+        return {
+            "status": "ok",
+            "message": "",
+            "solution": {
+                "url": params["url"],
+                "status": 200,
+                "response": self.pages[name],
+            },
+        }
+
+    def start(self):
+        """Starts serving in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fakesolver")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the server."""
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,241 @@
+"""
+The benchmarked scenarios.
+
+Every scenario is a function receiving the Environment. It returns a
+(prepare, run)-tuple: prepare is called before every run and is not
+timed, run is the timed part.
+"""
+import collections
+import operator
+import threading
+import time
+
+from lxml import html
+
+from ffn_bot import site
+from ffn_bot.cache import default_cache
+from ffn_bot.commentparser import MAX_REPLY_LENGTH, collect_stories, formulate_reply, render_parts
+from ffn_bot.fetchers import registry
+from ffn_bot.htmlparse import parse_until
+from ffn_bot.packing import pack
+from ffn_bot.slim import MAX_COMMENT_LENGTH, PAYLOAD_OVERHEAD, attach_payload, payload_share, render_slim
+
+from benchmarks import fakereddit
+from benchmarks.fakesolver import load_fixture
+
+BOT_NAME = "FanfictionBot"
+FOOTER = "\n\n---\n\n*FanfictionBot*^(bench)"
+
+# One story of every site.
+ALL_SITES = (
+    "linkffn(12345) linkfp(54321) linkao3(67890) linksiye(2468) "
+    "linkffa(1357) linkaff(hp:600012345)")
+# The maximum number of stories in one post.
+MANY_STORIES = "linkffn(%s)" % ";".join(str(i) for i in range(1000, 1030))
+# The number of comments requesting the same stories at once.
+BURST_SIZE = 8
+
+SCENARIOS = collections.OrderedDict()
+
+
+def scenario(name):
+    def _decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return _decorator
+
+
+def clear_cache():
+    default_cache.cache.clear()
+
+
+def warm_cache(body):
+    clear_cache()
+    list(formulate_reply(body))
+
+
+def rendered_stories(body):
+    """Returns the (text, length, record)-tuples of the stories."""
+    rendered = []
+    for story in collect_stories(body):
+        if isinstance(story, site.Story):
+            text = str(story)
+            rendered.append((text, len(text), story.get_record()))
+    return rendered
+
+
+def bot_comment(body, payload=True):
+    """Renders the reply the bot would send to the body."""
+    text, records = next(render_parts(collect_stories(body)))
+    if not payload:
+        return text + FOOTER
+    return attach_payload(text, records, FOOTER)
+
+
+# Metadata parsers
+
+def _metaparser(parser, fixture, id, stop=None, number=50):
+    page = load_fixture(fixture)
+    tree = html.fromstring(page) if stop is None else parse_until(page, stop)
+
+    def run():
+        for _ in range(number):
+            parser(id, tree)
+    return None, run
+
+
+@scenario("metaparse.ffn")
+def metaparse_ffn(env):
+    from ffn_bot.fetchers.ffn import FFN_STORY_TEXT
+    return _metaparser(registry.get("linkffn").parser, "ffn.html", None, FFN_STORY_TEXT)
+
+
+@scenario("metaparse.fp")
+def metaparse_fp(env):
+    from ffn_bot.fetchers.ffn import FFN_STORY_TEXT
+    return _metaparser(registry.get("linkfp").parser, "fp.html", None, FFN_STORY_TEXT)
+
+
+@scenario("metaparse.ao3")
+def metaparse_ao3(env):
+    from ffn_bot.fetchers.ao3 import AO3_CHAPTERS, AO3Metadata
+    return _metaparser(AO3Metadata, "ao3.html", "67890", AO3_CHAPTERS)
+
+
+@scenario("metaparse.siye")
+def metaparse_siye(env):
+    from ffn_bot.fetchers.siye import SIYEMetadata
+    return _metaparser(SIYEMetadata, "siye.html", "2468")
+
+
+@scenario("metaparse.ffa")
+def metaparse_ffa(env):
+    from ffn_bot.fetchers.ffa import FFAMetadata
+    return _metaparser(FFAMetadata, "ffa.html", "1357")
+
+
+@scenario("metaparse.aff")
+def metaparse_aff(env):
+    from ffn_bot.fetchers.aff import AFFMetadata
+    return _metaparser(AFFMetadata, "aff.html", ("hp", "600012345"))
+
+
+# Replies
+
+@scenario("formulate_reply.cold")
+def formulate_reply_cold(env):
+    return clear_cache, lambda: list(formulate_reply(ALL_SITES))
+
+
+@scenario("formulate_reply.cold_30")
+def formulate_reply_cold_30(env):
+    return clear_cache, lambda: list(formulate_reply(MANY_STORIES))
+
+
+@scenario("formulate_reply.cold_burst")
+def formulate_reply_cold_burst(env):
+    # Comments of a hot thread asking for the same stories concurrently.
+    def run():
+        threads = [threading.Thread(target=lambda: list(formulate_reply(ALL_SITES)))
+                   for _ in range(BURST_SIZE)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return clear_cache, run
+
+
+@scenario("formulate_reply.warm_30")
+def formulate_reply_warm_30(env):
+    warm_cache(MANY_STORIES)
+    return None, lambda: list(formulate_reply(MANY_STORIES))
+
+
+@scenario("slimify_comment.payload")
+def slimify_comment_payload(env):
+    from ffn_bot.reddit_bot import slimify_comment
+    warm_cache(MANY_STORIES)
+    comment = bot_comment(MANY_STORIES)
+    return None, lambda: slimify_comment(comment)
+
+
+@scenario("slimify_comment.legacy")
+def slimify_comment_legacy(env):
+    from ffn_bot.reddit_bot import slimify_comment
+    warm_cache(MANY_STORIES)
+    comment = bot_comment(MANY_STORIES, payload=False)
+    return None, lambda: slimify_comment(comment)
+
+
+@scenario("pack.reply")
+def pack_reply(env):
+    warm_cache(MANY_STORIES)
+    rendered = rendered_stories(MANY_STORIES) * 10
+    return None, lambda: list(pack(rendered, MAX_REPLY_LENGTH, length=operator.itemgetter(1)))
+
+
+@scenario("pack.slim")
+def pack_slim(env):
+    warm_cache(MANY_STORIES)
+    slim = [(render_slim(record), record, payload_share(record))
+            for _, _, record in rendered_stories(MANY_STORIES)] * 10
+    limit = MAX_COMMENT_LENGTH - len(FOOTER) - PAYLOAD_OVERHEAD
+    return None, lambda: list(pack(slim, limit, length=lambda item: len(item[0]) + item[2]))
+
+
+# Dispatch
+
+def install_bot(reddit):
+    """Sets up the globals load_config would set."""
+    from ffn_bot import reddit_bot
+    from ffn_bot.outbox import default_outbox
+    from ffn_bot.state import Application, ProcessedStore, Watermark
+
+    reddit_bot.r = reddit
+    reddit_bot.BOT_USERNAME = BOT_NAME
+    reddit_bot.SUBREDDIT_LIST = {"bench"}
+    reddit_bot.FOOTER = FOOTER
+    reddit_bot.__version__ = "bench"
+    reddit_bot.DRY_RUN = False
+    reddit_bot.COUNT_REPLIES = {}
+    reddit_bot.COUNT_REPLIES_LIMIT = 30
+    reddit_bot.TIME_TO_RESET = 86400
+    reddit_bot.TIME_SINCE_RESET = time.time()
+    reddit_bot.WATERMARK = Watermark()
+    reddit_bot.PROCESSED = ProcessedStore()
+    Application.reset().comments = reddit_bot.PROCESSED
+
+    # Do not pace the stub replies.
+    default_outbox.configure({"reply_rate": 60 * 10 ** 6, "reply_burst": 10 ** 6})
+    return reddit_bot
+
+
+@scenario("handle.comment")
+def handle_comment(env):
+    reddit_bot = install_bot(fakereddit.Reddit())
+    warm_cache(MANY_STORIES)
+    return None, lambda: reddit_bot.handle(fakereddit.Comment(MANY_STORIES))
+
+
+@scenario("handle.submission_cold")
+def handle_submission_cold(env):
+    reddit_bot = install_bot(fakereddit.Reddit())
+    return clear_cache, lambda: reddit_bot.handle(fakereddit.Submission(ALL_SITES))
+
+
+@scenario("handle.linksub")
+def handle_linksub(env):
+    warm_cache(MANY_STORIES)
+    threads = [
+        fakereddit.Submission("", comments=[
+            fakereddit.Comment(bot_comment(MANY_STORIES), author=BOT_NAME),
+            fakereddit.Comment("Great list!"),
+        ])
+        for _ in range(3)]
+    reddit_bot = install_bot(fakereddit.Reddit(threads))
+    body = "linksub(%s)" % ";".join(thread.id for thread in threads)
+
+    def prepare():
+        for thread in threads:
+            default_cache.invalidate("linksub", thread.id)
+    return prepare, lambda: reddit_bot.handle(fakereddit.Comment(body))
@@ -1,9 +1,14 @@
+import json
+import logging
 import random
+import sqlite3
+import threading
 import time
 from collections import OrderedDict
-import requests
-import json
-from googlesearch import search
+from urllib.parse import urlparse
+
+from ffn_bot import metrics
+from ffn_bot.solver import SolverError, default_client
 
 
 class LimitedSizeDict(OrderedDict):
@@ -24,6 +29,129 @@ class LimitedSizeDict(OrderedDict):
                 self.popitem(last=False)
 
 
+class SQLiteStore(object):
+    """
+    Persistent storage for cached values.
+
+    Every entry is stored as JSON together with the time it has
+    been created so it can expire the same way the in-memory
+    entries do.
+    """
+
+    # Prune the table every n writes.
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path, table="cache", max_size=None):
+        self.path = path
+        self.table = table
+        self.max_size = max_size
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS %s ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, time REAL NOT NULL"
+                ")" % self.table)
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS %s_time ON %s (time)"
+                % (self.table, self.table))
+
+    def get(self, key):
+        """Returns a (value, time)-tuple or None if the key is unknown."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, time FROM %s WHERE key = ?" % self.table,
+                (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, t):
+        """Stores the value."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO %s (key, value, time) VALUES (?, ?, ?)"
+                % self.table, (key, json.dumps(value), t))
+            self._writes += 1
+            if self._writes % self.PRUNE_INTERVAL == 0:
+                self._prune()
+
+    def delete(self, key):
+        """Removes the value from the store."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM %s WHERE key = ?" % self.table, (key,))
+
+    def delete_value(self, value):
+        """Removes all keys with the value from the store."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM %s WHERE value = ?" % self.table, (json.dumps(value),))
+
+    def _prune(self):
+        # Drop the oldest entries if the table grew too large.
+        if self.max_size is None:
+            return
+        self._connection.execute(
+            "DELETE FROM {0} WHERE key IN ("
+            "SELECT key FROM {0} ORDER BY time DESC LIMIT -1 OFFSET ?"
+            ")".format(self.table), (self.max_size,))
+
+
+class _Call(object):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs only one call per key at a time.
+
+    Callers asking for a key that is already being loaded wait for
+    the running call and share its result or error.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Calls the function unless a call for the key is already running.
+
+        :param key:   The key of the call.
+        :param func:  The function to call.
+        :returns: A (result, shared)-tuple. shared is True if the
+                  result came from the call of another thread.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = func()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+
 class RequestCache(object):
     """
     Cache for search requests and page-loads.
@@ -32,64 +160,300 @@ class RequestCache(object):
     # Marker for non cached objects.
     EMPTY_RESULT = []
 
-    def __init__(self, max_size=10000, expire_time=30 * 60 * 1000):
+    # Default expiry times (in seconds) for each namespace.
+    # Searches map titles to urls and hardly ever change, while
+    # pages contain stats that become outdated within hours.
+    DEFAULT_EXPIRE_TIMES = {
+        "search": 30 * 24 * 60 * 60,
+        "get": 60 * 60,
+        "linksub": 6 * 60 * 60,
+        # Failures, kept longer than their backoff so a repeated
+        # failure backs off further.
+        "miss": 24 * 60 * 60,
+    }
+
+    # Time (in seconds) a failure is remembered by reason. The time
+    # doubles with every failure in a row, up to MAX_NEGATIVE_TIME.
+    DEFAULT_NEGATIVE_TIMES = {
+        "does-not-exist": 30 * 60,
+        "search-miss": 60 * 60,
+        "solver-failure": 60,
+    }
+    MAX_NEGATIVE_TIME = 12 * 60 * 60
+
+    def __init__(self, max_size=10000, expire_time=30 * 60, store=None, client=None):
         self.cache = LimitedSizeDict(size_limit=max_size)
+        # Fallback for namespaces without a policy.
         self.expire_time = expire_time
+        # Expiry times by namespace. Namespaces can be refined
+        # with dots: "get.fanfiction.net" overrides "get".
+        self.expire_times = dict(self.DEFAULT_EXPIRE_TIMES)
+        self.store = store
+        self.client = default_client if client is None else client
+        # Wait before loading uncached pages, as the sites ask for.
+        self.throttle = True
+        # Concurrent loads of the same page or search share one request.
+        self.flights = SingleFlight()
+        # Backoff times of the negative cache by reason.
+        self.negative_times = dict(self.DEFAULT_NEGATIVE_TIMES)
+        self.max_negative_time = self.MAX_NEGATIVE_TIME
+
+    def get_expire_time(self, policy):
+        """
+        Returns the time in seconds a value in the given namespace is
+        considered fresh.
+
+        :param policy:  The namespace, optionally refined with dots.
+        """
+        while policy:
+            if policy in self.expire_times:
+                return self.expire_times[policy]
+            policy = policy.rpartition(".")[0]
+        return self.expire_time
 
-    def hit_cache(self, type, query):
+    def hit_cache(self, type, query, policy=None):
         """Check if the value is in the cache."""
+        expire_time = self.get_expire_time(type if policy is None else policy)
+
+        cache_id = "%s:%s" % (type, query)
+        result = self.cache.get(cache_id, self.EMPTY_RESULT)
+        if result is self.EMPTY_RESULT and self.store is not None:
+            result = self.store.get(cache_id)
+            if result is None:
+                result = self.EMPTY_RESULT
 
-        result = self.cache.get("%s:%s" % (type, query), self.EMPTY_RESULT)
         if result is not self.EMPTY_RESULT:
             # Let values expire.
-            if time.time() - result[1] <= self.expire_time:
-                self.push_cache(type, query, result[0], result[1])
+            if time.time() - result[1] <= expire_time:
+                self._push_memory(cache_id, result[0], result[1])
                 return result[0]
+            # Do not keep expired pages around until they are pushed out.
+            self.cache.pop(cache_id, None)
         raise KeyError("Not cached")
 
     def push_cache(self, type, query, data, t=None):
         """Push a value into the cache."""
         cache_id = "%s:%s" % (type, query)
-        if cache_id in self.cache:
-            del self.cache[cache_id]
         if t is None:
             t = time.time()
+        self._push_memory(cache_id, data, t)
+        if self.store is not None:
+            self.store.set(cache_id, data, t)
+
+    def invalidate(self, type, query):
+        """Removes a value from the cache."""
+        cache_id = "%s:%s" % (type, query)
+        self.cache.pop(cache_id, None)
+        if self.store is not None:
+            self.store.delete(cache_id)
+
+    def _push_memory(self, cache_id, data, t):
+        if cache_id in self.cache:
+            del self.cache[cache_id]
         self.cache[cache_id] = (data, t)
 
-    def get_page(self, page, throttle=0, **kwargs):
-        print("LOADING: " + str(page))
+    @staticmethod
+    def failure_key(kind, query):
+        """Returns the key of a failure, ignoring case and whitespace."""
+        return kind + ":" + " ".join(str(query).lower().split())
+
+    def get_failure(self, kind, query):
+        """
+        Checks the negative cache.
+
+        :param kind:   The kind of the query. (e.g. get, search, story)
+        :param query:  The url or search query.
+        :returns: The reason of a recent failure or None.
+        """
         try:
-            return self.hit_cache("get", page)
+            failure = self.hit_cache("miss", self.failure_key(kind, query))
+        except KeyError:
+            return None
+        if time.time() >= failure["until"]:
+            return None
+        metrics.CACHE_REQUESTS.inc(namespace="miss", result=failure["reason"])
+        return failure["reason"]
+
+    def add_failure(self, kind, query, reason):
+        """
+        Remembers a failure, backing off further if it failed before.
+
+        :param kind:    The kind of the query. (e.g. get, search, story)
+        :param query:   The url or search query.
+        :param reason:  The reason code. (e.g. does-not-exist)
+        """
+        key = self.failure_key(kind, query)
+        try:
+            previous = self.hit_cache("miss", key)
+        except KeyError:
+            previous = None
+
+        failures = 1
+        if previous is not None and previous["reason"] == reason:
+            failures = previous["failures"] + 1
+        delay = min(
+            self.negative_times.get(reason, self.expire_time) * 2 ** (failures - 1),
+            self.max_negative_time)
+
+        t = time.time()
+        self.push_cache("miss", key, {"reason": reason, "failures": failures, "until": t + delay}, t)
+        logging.debug(
+            "(Cache) Remembering %s of %s for %ds", reason, query, delay,
+            extra={"query": query, "reason": reason, "failures": failures, "backoff": delay})
+
+    def clear_failure(self, kind, query):
+        """Forgets the failures of a query that succeeded again."""
+        key = self.failure_key(kind, query)
+        # get_failure loads known failures into memory before every
+        # request, so the store only has to be touched if it failed.
+        if "miss:" + key in self.cache:
+            self.invalidate("miss", key)
+
+    @staticmethod
+    def get_page_policy(page):
+        """Returns the expiry namespace of the given url."""
+        domain = urlparse(page).netloc.lower()
+        if domain.startswith("www."):
+            domain = domain[len("www."):]
+        return "get." + domain
+
+    def get_page(self, page, throttle=0, stop=None, **kwargs):
+        """
+        Loads the page from the cache or using the solver.
+
+        :param page:      The url of the page.
+        :param throttle:  Seconds to wait before loading an uncached page.
+        :param stop:      A regular expression matching the first tag that
+                          is never read. Only the part in front of it is
+                          cached. (See htmlparse.cut_before)
+        """
+        policy = self.get_page_policy(page)
+        try:
+            result = self.hit_cache("get", page, policy)
+            metrics.CACHE_REQUESTS.inc(namespace="get", result="hit")
+            logging.debug("(Cache) Loaded %s from the cache", page, extra={"url": page, "cache": "hit"})
+            return result
         except KeyError:
             pass
 
+        reason = self.get_failure("get", page)
+        if reason is not None:
+            raise SolverError("{0} failed recently ({1})".format(page, reason))
+
+        result, shared = self.flights.do(
+            "get:" + page, lambda: self._load_page(page, policy, throttle, stop))
+        if shared:
+            metrics.CACHE_REQUESTS.inc(namespace="get", result="coalesced")
+        return result
+
+    def _load_page(self, page, policy, throttle, stop):
+        # Another thread may have loaded the page since we checked.
+        try:
+            result = self.hit_cache("get", page, policy)
+            metrics.CACHE_REQUESTS.inc(namespace="get", result="hit")
+            return result
+        except KeyError:
+            metrics.CACHE_REQUESTS.inc(namespace="get", result="miss")
+
         # Throtle only if we don't have a version cached.
-        if throttle:
+        if throttle and self.throttle:
             time.sleep(throttle)
-        
-        headers = {"Content-Type": "application/json"}
-        data = {
-            "cmd": "request.get",
-            "maxTimeout": 120000,
-            "url": page
-        }
-
-        response = requests.post('http://localhost:8191/v1', data=json.dumps(data), headers=headers)
-        content = json.loads(response.content)
-        return content['solution']['response']
+
+        domain = policy[len("get."):]
+        start = time.perf_counter()
+        try:
+            with metrics.PAGE_LOAD_TIME.timer(domain=domain):
+                result = self.client.get(page)
+        except SolverError as e:
+            # Missing pages will not come back soon, everything else
+            # might just be a hiccup of the site or the solver.
+            missing = e.status in (404, 410)
+            self.add_failure("get", page, "does-not-exist" if missing else "solver-failure")
+            raise
+        self.clear_failure("get", page)
+        metrics.PAGE_SIZE.observe(len(result or ""), domain=domain)
+        logging.debug(
+            "(Cache) Loaded %s", page,
+            extra={"url": page, "cache": "miss", "duration": time.perf_counter() - start,
+                   "size": len(result or "")})
+        if stop is not None and result:
+            # The rest of the page (e.g. the chapter text) is never read.
+            from ffn_bot.htmlparse import cut_before
+            result = cut_before(result, stop)
+        self.push_cache("get", page, result)
+        return result
 
     def search(self, query):
-        print("SEARCHING: " + str(query))
         try:
-            return self.hit_cache("search", query)
+            result = self.hit_cache("search", query)
+            metrics.CACHE_REQUESTS.inc(namespace="search", result="hit")
+            logging.debug("(Cache) Found %r in the cache", query, extra={"query": query, "cache": "hit"})
+            return result
         except KeyError:
             pass
 
+        if self.get_failure("search", query) is not None:
+            return None
+
+        result, shared = self.flights.do("search:" + query, lambda: self._search(query))
+        if shared:
+            metrics.CACHE_REQUESTS.inc(namespace="search", result="coalesced")
+        return result
+
+    def _search(self, query):
+        # Another thread may have searched the query since we checked.
+        try:
+            result = self.hit_cache("search", query)
+            metrics.CACHE_REQUESTS.inc(namespace="search", result="hit")
+            return result
+        except KeyError:
+            metrics.CACHE_REQUESTS.inc(namespace="search", result="miss")
+
         time.sleep(random.randint(2000, 5000) / 1000.0)
 
-        result = next(search(query, num=1, stop=1), None)
+        # googlesearch pulls in bs4 and requests, so only import it
+        # when we actually have to search.
+        from googlesearch import search
+        start = time.perf_counter()
+        with metrics.SEARCH_TIME.timer():
+            result = next(search(query, num=1, stop=1), None)
+        logging.debug(
+            "(Cache) Searched %r", query,
+            extra={"query": query, "cache": "miss", "duration": time.perf_counter() - start,
+                   "result": result})
+        if result is None:
+            # Retry unknown titles much earlier than found ones,
+            # the story might just not be indexed yet.
+            self.add_failure("search", query, "search-miss")
+            return None
+        self.clear_failure("search", query)
         self.push_cache("search", query, result)
         return result
 
+    def configure(self, section):
+        """
+        Configures the cache using the [Cache]-section of the config file.
+
+        :param section:  The section of the config file.
+        """
+        self.cache.size_limit = int(section.get("max_size", self.cache.size_limit))
+        self.cache._check_size_limit()
+
+        self.throttle = section.get("throttle", "true").lower() == "true"
+
+        self.expire_time = int(section.get("expire", self.expire_time))
+        for key, value in section.items():
+            if key.startswith("expire."):
+                self.expire_times[key[len("expire."):]] = int(value)
+            elif key.startswith("negative."):
+                self.negative_times[key[len("negative."):]] = int(value)
+        self.max_negative_time = int(section.get("negative_max", self.max_negative_time))
+
+        path = section.get("path", "").strip()
+        if path:
+            logging.info("(Cache) Using persistent cache at {0}".format(path))
+            self.store = SQLiteStore(
+                path, max_size=int(section.get("store_size", 5000)))
+
 
 default_cache = RequestCache()
@@ -2,9 +2,13 @@
 This file handles the comment parsing.
 """
 import itertools
+import operator
 
 from ffn_bot import site
+from ffn_bot.packing import pack
 from ffn_bot.parser import Request
+from ffn_bot.parser.scanner import scan
+from ffn_bot.prefetch import prefetch_stories
 
 MAX_REPLY_LENGTH = 8000
 MAX_STORIES_PER_POST = 30
@@ -39,11 +43,11 @@ def parse_context_markers(comment_body):
     # The power of generators, harnessed in this oneliner
     return set(
         s.lower() for s in itertools.chain.from_iterable(
-            v.split(",") for v in Request.CONTEXT_MARKER_REGEX.findall(comment_body)))
+            v.split(",") for v in scan(comment_body).markers))
 
 
-def formulate_reply(comment_body, markers=None, additions=()):
-    """Creates the reply for the given comment."""
+def collect_stories(comment_body, markers=None, additions=()):
+    """Parses the request and loads all requested stories."""
     if markers is None:
         markers = set()
 
@@ -53,34 +57,69 @@ def formulate_reply(comment_body, markers=None, additions=()):
         request = comment_body
     request.parse()
 
-    yield from parse_comment_requests(list(itertools.chain(request.stories, additions)))
+    return prepare_stories(list(itertools.chain(request.stories, additions)))
 
 
-def parse_comment_requests(results):
+def prepare_stories(results):
     """
-    Executes the queries and return the
-    generated story strings as a single string
+    Checks the story limit and loads all stories at once
+    instead of one by one while rendering.
     """
     if len(tuple(filter(
             lambda x: isinstance(x, site.Story), results
     ))) > MAX_STORIES_PER_POST:
         raise StoryLimitExceeded("Maximum exceeded.")
 
-    cur_part = []
-    length = 0
-    for part in results:
-        if not part:
-            continue
+    prefetch_stories(results)
+    return results
 
-        if length + len(str(part)) >= MAX_REPLY_LENGTH:
-            yield "".join(str(p) for p in cur_part)
-            cur_part = []
-            length = 0
 
-        cur_part.append(part)
-        length += len(str(part))
+def formulate_reply(comment_body, markers=None, additions=()):
+    """Creates the reply for the given comment."""
+    yield from parse_comment_requests(
+        collect_stories(comment_body, markers, additions))
+
+
+def formulate_reply_parts(comment_body, markers=None, additions=()):
+    """
+    Creates the reply for the given comment.
+
+    :returns: A generator of (text, records)-tuples, one for each reply.
+    """
+    yield from render_parts(
+        collect_stories(comment_body, markers, additions))
+
 
-    if len(cur_part) > 0:
-        result = "".join(str(p) for p in cur_part)
+def parse_comment_requests(results):
+    """
+    Executes the queries and return the
+    generated story strings as a single string
+    """
+    for text, _ in render_parts(results):
+        yield text
+
+
+def render_parts(results):
+    """
+    Renders the results and splits them into replies.
+
+    :returns: A generator of (text, records)-tuples, one for each reply.
+    """
+    prepare_stories(results)
+
+    # Render every story exactly once.
+    rendered = []
+    for part in results:
+        if not part:
+            continue
+        text = str(part)
+        record = None
+        if text and isinstance(part, site.Story):
+            record = part.get_record()
+        rendered.append((text, len(text), record))
+
+    for chunk in pack(rendered, MAX_REPLY_LENGTH, length=operator.itemgetter(1)):
+        result = "".join(text for text, _, _ in chunk)
         if result:
-            yield result
+            yield result, [record for _, _, record in chunk if record is not None]
+
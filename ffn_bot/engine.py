@@ -0,0 +1,120 @@
+"""
+Event driven core of the bot.
+
+The reddit streams are blocking iterators (praw is synchronous),
+so every stream is consumed in its own thread. The posts are sent
+into an asyncio loop which dispatches them to the handler on a
+bounded worker pool.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ffn_bot import logs, metrics
+
+# Priorities of the lanes. Lower values are handled first.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+
+
+class StreamEngine(object):
+    """
+    Handles the posts of multiple streams concurrently.
+    """
+
+    def __init__(self, handler, concurrency=4, restart_delay=10):
+        """
+        :param handler:        The function that handles a single post.
+        :param concurrency:    The number of posts handled at the same time.
+        :param restart_delay:  Seconds to wait before restarting a failed stream.
+        """
+        self.handler = handler
+        self.concurrency = concurrency
+        self.restart_delay = restart_delay
+        self.streams = []
+
+        self._loop = None
+        self._queue = None
+        self._counter = itertools.count()
+
+    def add_stream(self, name, factory, priority=PRIORITY_NORMAL, filter=None):
+        """
+        Adds a stream to the engine.
+
+        :param name:      The name of the stream.
+        :param factory:   A function returning a new iterator over the posts.
+        :param priority:  The lane of the posts.
+        :param filter:    A function that decides if a post should be handled.
+        """
+        self.streams.append((name, factory, priority, filter))
+
+    def run(self):
+        """Runs the engine forever."""
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+
+        for name, factory, priority, filter in self.streams:
+            thread = threading.Thread(
+                target=self._produce,
+                args=(name, factory, priority, filter),
+                name="stream-" + name)
+            thread.daemon = True
+            thread.start()
+            logging.info("(Stream Strategy) Began stream type: {0}".format(name))
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="handler")
+        slots = asyncio.Semaphore(self.concurrency)
+        try:
+            while True:
+                # Only take posts out of the queue when a worker is free,
+                # so posts of a higher priority can still overtake them.
+                await slots.acquire()
+                _, _, post, name, queued = await self._queue.get()
+                metrics.QUEUE_DEPTH.set(self._queue.qsize())
+                metrics.QUEUE_WAIT.observe(time.monotonic() - queued, stream=name)
+                task = self._loop.run_in_executor(executor, self._handle, post, name)
+                task.add_done_callback(
+                    lambda future, post=post: self._done(future, post, slots))
+        finally:
+            executor.shutdown(wait=False)
+
+    def _handle(self, post, name):
+        with logs.context(request_id=getattr(post, "fullname", None), stream=name):
+            with metrics.HANDLE_TIME.timer(stream=name):
+                self.handler(post)
+
+    def _done(self, future, post, slots):
+        slots.release()
+        exc = future.exception()
+        if exc is not None:
+            logging.error("(Stream Strategy) Failed to handle %s", post, exc_info=exc)
+
+    def _put(self, priority, post, name, queued):
+        self._queue.put_nowait((priority, next(self._counter), post, name, queued))
+        metrics.QUEUE_DEPTH.set(self._queue.qsize())
+
+    def _produce(self, name, factory, priority, filter):
+        while True:
+            try:
+                for post in factory():
+                    if post is None:
+                        continue
+                    if filter is not None and not filter(post):
+                        metrics.POSTS.inc(stream=name, result="filtered")
+                        continue
+                    logging.info("Queueing Post: %s", post)
+                    metrics.POSTS.inc(stream=name, result="queued")
+                    self._loop.call_soon_threadsafe(
+                        self._put, priority, post, name, time.monotonic())
+                logging.info("(Stream Strategy) Stream ended: {0}".format(name))
+                return
+            except Exception:
+                logging.exception("(Stream Strategy) Restarting failed stream: %s", name)
+                time.sleep(self.restart_delay)
@@ -1,45 +1,90 @@
+"""
+Registry of the supported sites.
+
+The sites are declared in MANIFEST and their modules are only
+imported when a request for their command is found. To add a site,
+drop its module into this package and add it to the manifest.
+"""
 import collections
-import os.path
-from pkgutil import iter_modules
+import importlib
+import threading
+
+# (command, module, class) of every site, in the order the requests
+# are answered.
+MANIFEST = (
+    ("linkaff", "aff", "AdultFanfiction"),
+    ("linkao3", "ao3", "ArchiveOfOurOwn"),
+    ("linkffa", "ffa", "HPFanfictionArchive"),
+    ("linkffn", "ffn", "FanfictionNetSite"),
+    ("linkfp", "ffn", "FictionPressSite"),
+    ("linksiye", "siye", "SinkIntoYourEyes"),
+)
+
+COMMANDS = tuple(command for command, _, _ in MANIFEST)
+
+
+class SiteRegistry(object):
+    """
+    Creates the sites of the manifest on first use.
+    """
 
-from ffn_bot.site import Site
+    def __init__(self, manifest):
+        self.manifest = collections.OrderedDict(
+            (command.lower(), (module, cls)) for command, module, cls in manifest)
+        self._sites = {}
+        self._lock = threading.Lock()
 
+    def commands(self):
+        """Returns the commands of all sites without loading them."""
+        return tuple(self.manifest)
 
-# This bit of complexity allows the
-# Module to automatically discover its own fetchers
-# Just drop the python file in the directory and it will be loaded.
-def _try_caller(func):
-    try:
-        return func()
-    except Exception:
-        return None
+    def get(self, command):
+        """
+        Returns the site answering the command.
 
+        :param command:  The command of the site. (e.g. linkffn)
+        :returns: The site or None if the command is unknown.
+        """
+        command = command.lower()
+        site = self._sites.get(command)
+        if site is not None:
+            return site
+        if command not in self.manifest:
+            return None
 
-def _load_sites():
-    for loader, name, _ in iter_modules([os.path.dirname(__file__)]):
-        module = loader.find_module(name).load_module(name)
-        for var_name in dir(module):
-            item = getattr(module, var_name)
-            if isinstance(item, type) and issubclass(item, Site):
-                try:
-                    yield item()
-                except TypeError:
-                    pass
+        with self._lock:
+            if command not in self._sites:
+                module, cls = self.manifest[command]
+                module = importlib.import_module("." + module, __name__)
+                self._sites[command] = getattr(module, cls)()
+            return self._sites[command]
+
+    def all(self):
+        """Loads and returns all sites."""
+        return [self.get(command) for command in self.manifest]
+
+
+registry = SiteRegistry(MANIFEST)
 
 
 def get_site(name):
     """Returns the site by name"""
-    for site in SITES:
+    for site in registry.all():
         if site.name == name:
-            return site.name
+            return site
     return None
 
 
 def get_sites():
     """Returns a dictionary of all sites."""
-    return collections.OrderedDict((site.name, site) for site in SITES)
+    return collections.OrderedDict((site.name, site) for site in registry.all())
+
 
+def __getattr__(name):
+    # SITES loads every site, so it is only created when it is used.
+    if name == "SITES":
+        return registry.all()
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
 
-SITES = list(_load_sites())
 
-__all__ = ["SITES"]
+__all__ = ["COMMANDS", "MANIFEST", "SITES", "get_site", "get_sites", "registry"]
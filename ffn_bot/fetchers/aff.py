@@ -1,6 +1,6 @@
 import re
 
-from lxml import html
+from lxml import etree, html
 
 from ffn_bot import site
 from ffn_bot.cache import default_cache
@@ -33,9 +33,9 @@ AFF_BYPASS_COOKIE = (
     "HasVisited=bypass page next time; path=/; "
     "domain={0}.adult-fanfiction.org")
 
-AFF_TITLE_XPATH = "//html/head/title/text()"
-AFF_AUTHOR_NAME = "//tr[5]/td[2]//a/text()"
-AFF_AUTHOR_URL = "//tr[5]/td[2]//a/@href"
+AFF_TITLE_XPATH = etree.XPath("//html/head/title/text()")
+AFF_AUTHOR_NAME = etree.XPath("//tr[5]/td[2]//a/text()")
+AFF_AUTHOR_URL = etree.XPath("//tr[5]/td[2]//a/@href")
 
 # Since we don't have an explicit summary we will just access
 # the metadata ourselves.
@@ -47,6 +47,10 @@ class AFFMetadata(Metaparser):
     Functions that will determine the metadata.
     """
 
+    CATEGORY_XPATH = "//tr[5]//td[1]//a/text()"
+    CHAPTERS_XPATH = "//select[@name='chapnav']/option"
+    HITS_XPATH = "//tr[5]/td[3]/text()"
+
     @parser
     @staticmethod
     def add_id(id, tree):
@@ -58,19 +62,18 @@ class AFFMetadata(Metaparser):
     def Category(id, tree):
         return " > ".join(
             x.strip().replace(" - ", "-")
-            for x in tree.xpath("//tr[5]//td[1]//a/text()")
+            for x in AFFMetadata.CATEGORY_XPATH(tree)
             if x.strip() != "Next chapter>")
 
     @parser
     @staticmethod
     def Chapters(id, tree):
-        return len(tree.xpath("//select[@name='chapnav']/option"))
+        return str(len(AFFMetadata.CHAPTERS_XPATH(tree)))
 
     @parser
     @staticmethod
     def Hits(id, tree):
-        return tree.xpath(
-            "//tr[5]/td[3]/text()")[0].strip()[len("Hits: "):]
+        return AFFMetadata.HITS_XPATH(tree)[0].strip()[len("Hits: "):]
 
 
 class AdultFanfiction(Site):
@@ -109,6 +112,8 @@ class Story(site.Story):
     Implementation of a story
     """
 
+    __slots__ = ("archive", "id")
+
     def __init__(self, context, archive, id):
         super(Story, self).__init__(context)
         self.archive = archive
@@ -122,15 +127,13 @@ class Story(site.Story):
             },  # Do not even try to follow to the adult form url.
             allow_redirects=False))
 
-        self.tree = tree
-
         # We will generate the stats ourselves.
         self.stats = AFFMetadata((self.archive, self.id), tree)
-        self.title = tree.xpath(AFF_TITLE_XPATH)[0].strip()[
+        self.title = AFF_TITLE_XPATH(tree)[0].strip()[
                      len("Story: "):
                      ]
-        self.author = tree.xpath(AFF_AUTHOR_NAME)[0].strip()
-        self.authorlink = tree.xpath(AFF_AUTHOR_URL)[0]
+        self.author = AFF_AUTHOR_NAME(tree)[0].strip()
+        self.authorlink = AFF_AUTHOR_URL(tree)[0]
 
     def get_summary(self):
         return AFF_DEFAULT_SUMMARY
@@ -2,13 +2,15 @@ import itertools
 import logging
 import re
 
-from lxml import html
+from lxml import etree
 from lxml.cssselect import CSSSelector
 
 from ffn_bot import site
 from ffn_bot.bot_tools import safe_int
 from ffn_bot.cache import default_cache
+from ffn_bot.htmlparse import parse_until
 from ffn_bot.metaparse import Metaparser, parser
+from ffn_bot.titleindex import default_index
 from ffn_bot.site import Site
 
 __all__ = ["ArchiveOfOurOwn"]
@@ -17,15 +19,18 @@ AO3_LINK_REGEX = AO3_LINK_REGEX = re.compile(
     r"http(s)?://([^.]+\.)?archiveofourown.org/works/(?P<sid>\d+)[^ ]*",
     re.IGNORECASE)
 AO3_FUNCTION = "linkao3"
+# The chapters follow the metadata of the work.
+AO3_CHAPTERS = re.compile(r"""id=["']?chapters\b""")
 AO3_SEARCH_QUERY = "site:archiveofourown.org/works/ %s"
-AO3_AUTHOR_NAME = '//h3[@class="byline heading"]/a[@rel="author"]/text()'
-AO3_AUTHOR_URL = '//h3[@class="byline heading"]/a[@rel="author"]/@href'
-AO3_META_PARTS = '//dl[@class="stats"]//text()'
-AO3_TITLE = '//h2/text()'
-AO3_SUMMARY_FINDER = '//*[@id="workskin"]//*[@class="summary module" and @role="complementary"]/blockquote//text()'
-AO3_FANDOM_TAGS = CSSSelector("dd.fandom ul li").path + "//text()"
-AO3_EPUB_DOWNLOAD = './/a[contains(text(),"EPUB")]/@href'
-AO3_MOBI_DOWNLOAD = './/a[contains(text(),"MOBI")]/@href'
+AO3_AUTHOR_NAME = etree.XPath('//h3[@class="byline heading"]/a[@rel="author"]/text()')
+AO3_AUTHOR_URL = etree.XPath('//h3[@class="byline heading"]/a[@rel="author"]/@href')
+AO3_META_PARTS = etree.XPath('//dl[@class="stats"]//text()')
+AO3_TITLE = etree.XPath('//h2/text()')
+AO3_SUMMARY_FINDER = etree.XPath(
+    '//*[@id="workskin"]//*[@class="summary module" and @role="complementary"]/blockquote//text()')
+AO3_FANDOM_TAGS = etree.XPath(CSSSelector("dd.fandom ul li").path + "//text()")
+AO3_EPUB_DOWNLOAD = etree.XPath('.//a[contains(text(),"EPUB")]/@href')
+AO3_MOBI_DOWNLOAD = etree.XPath('.//a[contains(text(),"MOBI")]/@href')
 
 
 class AO3Metadata(Metaparser):
@@ -33,7 +38,7 @@ class AO3Metadata(Metaparser):
     @parser
     @staticmethod
     def parse_fandom(id, tree):
-        res = tree.xpath(AO3_FANDOM_TAGS)
+        res = AO3_FANDOM_TAGS(tree)
         if len(res) > 1:
             yield "Fandoms", ", ".join(res)
         elif len(res) == 0:
@@ -44,7 +49,7 @@ class AO3Metadata(Metaparser):
     @parser
     @staticmethod
     def parse_basemeta(id, tree):
-        res = tree.xpath(AO3_META_PARTS)
+        res = AO3_META_PARTS(tree)
 
         yield from (
             (k[:-1], v)
@@ -100,7 +105,8 @@ class ArchiveOfOurOwn(Site):
         if match is not None:
             return request
 
-        return default_cache.search(AO3_SEARCH_QUERY % request)
+        return default_index.resolve(
+            "archiveofourown.org", request, AO3_SEARCH_QUERY % request)
 
     def generate_response(self, link, context):
         assert link is not None
@@ -120,10 +126,12 @@ class ArchiveOfOurOwn(Site):
 
 class Story(site.Story):
 
+    __slots__ = ("download",)
+
     def __init__(self, url, context=None):
         super(Story, self).__init__(context)
         self.url = url
-        self.raw_stats = []
+        self.download = None
         self.stats = ""
         self.title = ""
         self.author = ""
@@ -131,29 +139,32 @@ class Story(site.Story):
         self.summary = ""
 
     def get_real_url(self):
-        return "https://archiveofourown.org/works/%s?view_adult=true" % AO3_LINK_REGEX.match(self.url).groupdict()[
+        # Only load the first chapter instead of the whole work.
+        return "https://archiveofourown.org/works/%s?view_adult=true&view_full_work=false" % AO3_LINK_REGEX.match(self.url).groupdict()[
             "sid"]
 
     def get_url(self):
         return "https://archiveofourown.org/works/%s" % AO3_LINK_REGEX.match(self.url).groupdict()["sid"]
 
-    def get_value_from_tree(self, xpath, sep=""):
-        return sep.join(self.tree.xpath(xpath)).strip()
+    @staticmethod
+    def get_value_from_tree(tree, xpath, sep=""):
+        return sep.join(xpath(tree)).strip()
 
     def parse_html(self):
-        page = default_cache.get_page(self.get_real_url())
-        self.tree = html.fromstring(page)
-        self.summary = self.get_value_from_tree(AO3_SUMMARY_FINDER)
-        self.title = self.get_value_from_tree(AO3_TITLE)
-        self.author = self.get_value_from_tree(AO3_AUTHOR_NAME)
-        self.authorlink = "https://www.archiveofourown.org" + self.get_value_from_tree(AO3_AUTHOR_URL)
+        page = default_cache.get_page(self.get_real_url(), stop=AO3_CHAPTERS)
+        tree = parse_until(page, AO3_CHAPTERS)
+        self.summary = self.get_value_from_tree(tree, AO3_SUMMARY_FINDER)
+        self.title = self.get_value_from_tree(tree, AO3_TITLE)
+        self.author = self.get_value_from_tree(tree, AO3_AUTHOR_NAME)
+        self.authorlink = "https://www.archiveofourown.org" + self.get_value_from_tree(tree, AO3_AUTHOR_URL)
         self.stats = AO3Metadata(
-            AO3_LINK_REGEX.match(self.url).groupdict()["sid"], self.tree)
+            AO3_LINK_REGEX.match(self.url).groupdict()["sid"], tree)
+        self.download = (
+            "https://archiveofourown.org" + self.get_value_from_tree(tree, AO3_EPUB_DOWNLOAD),
+            "https://archiveofourown.org" + self.get_value_from_tree(tree, AO3_MOBI_DOWNLOAD))
 
     def get_site(self):
         return "Archive of Our Own", "https://www.archiveofourown.org/"
 
     def get_download(self):
-        epub_download = "https://archiveofourown.org" + self.get_value_from_tree(AO3_EPUB_DOWNLOAD)
-        mobi_download = "https://archiveofourown.org" + self.get_value_from_tree(AO3_MOBI_DOWNLOAD)
-        return (epub_download, mobi_download)
+        return self.download
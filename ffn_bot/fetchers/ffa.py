@@ -3,12 +3,13 @@
 import logging
 import re
 
-from lxml import html
+from lxml import etree, html
 
 from ffn_bot import site
 from ffn_bot.bot_tools import safe_int
 from ffn_bot.cache import default_cache
 from ffn_bot.metaparse import Metaparser, parser
+from ffn_bot.titleindex import default_index
 from ffn_bot.site import Site
 
 __all__ = ["HPFanfictionArchive"]
@@ -18,10 +19,10 @@ FFA_LINK_REGEX = re.compile(
 FFA_FUNCTION = "linkffa"
 FFA_SEARCH_QUERY = "http://www.hpfanficarchive.com/stories/viewstory.php?sid= %s"
 
-FFA_AUTHOR_NAME = '//*[@id="pagetitle"]/a[2]/text()'
-FFA_AUTHOR_URL = '//*[@id="pagetitle"]/a[2]/@href'
-FFA_SUMMARY_AND_META = '//*[@id="mainpage"]/div[4]//text()'
-FFA_TITLE = '//*[@id="pagetitle"]/a[1]/text()'
+FFA_AUTHOR_NAME = etree.XPath('//*[@id="pagetitle"]/a[2]/text()')
+FFA_AUTHOR_URL = etree.XPath('//*[@id="pagetitle"]/a[2]/@href')
+FFA_SUMMARY_AND_META = etree.XPath('//*[@id="mainpage"]/div[4]//text()')
+FFA_TITLE = etree.XPath('//*[@id="pagetitle"]/a[1]/text()')
 
 FFA_SPLITTER_REGEX = re.compile(
     "[A-Z][a-z ]*?[a-z]*?:.*?(?=\s*[A-Z](?:[a-z ]*?[a-z]*?:))"
@@ -33,7 +34,7 @@ class FFAMetadata(Metaparser):
     @parser
     @staticmethod
     def parse_metadata(id, tree):
-        summary_and_meta = ' '.join(tree.xpath(FFA_SUMMARY_AND_META))
+        summary_and_meta = ' '.join(FFA_SUMMARY_AND_META(tree))
         stats = summary_and_meta.split("Rated: ")
         stats[1] = "Rated: " + stats[1]
         stats = stats[1]
@@ -91,7 +92,8 @@ class HPFanfictionArchive(Site):
         if match is not None:
             return request
 
-        return default_cache.search(FFA_SEARCH_QUERY % request)
+        return default_index.resolve(
+            "hpfanficarchive.com", request, FFA_SEARCH_QUERY % request)
 
     def generate_response(self, link, context):
         assert link is not None
@@ -109,17 +111,17 @@ class HPFanfictionArchive(Site):
 
 class Story(site.Story):
 
+    __slots__ = ()
+
     def __init__(self, url, context=None):
         super(Story, self).__init__(context)
         self.url = url
-        self.raw_stats = []
 
         self.stats = ""
         self.title = ""
         self.author = ""
         self.authorlink = ""
         self.summary = ""
-        self.summary_and_meta = ""
 
     def get_url(self):
         return HPFanfictionArchive.id_to_url(
@@ -127,25 +129,24 @@ class Story(site.Story):
         )
 
     def parse_html(self):
-        self.tree = tree = html.fromstring(default_cache.get_page(self.url))
+        tree = html.fromstring(default_cache.get_page(self.url))
 
-        self.summary_and_meta = ' '.join(tree.xpath(FFA_SUMMARY_AND_META))
+        summary_and_meta = ' '.join(FFA_SUMMARY_AND_META(tree))
         self.summary = ''.join(
             re.findall(
                 'Summary: (.*?)(?=Rated:)',
-                self.summary_and_meta,
+                summary_and_meta,
                 re.DOTALL
             )
         ).replace("\n", " ").strip()
         self.stats = FFAMetadata(
             str(FFA_LINK_REGEX.match(self.url).groupdict()["sid"]),
-            self.tree
-
+            tree
         )
-        self.title = tree.xpath(FFA_TITLE)[0]
-        self.author = tree.xpath(FFA_AUTHOR_NAME)[0]
+        self.title = FFA_TITLE(tree)[0]
+        self.author = FFA_AUTHOR_NAME(tree)[0]
         self.authorlink = 'http://www.hpfanficarchive.com/stories/' + \
-                          tree.xpath(FFA_AUTHOR_URL)[0]
+                          FFA_AUTHOR_URL(tree)[0]
 
     def get_site(self):
         return "HP Fanfic Archive", "http://www.hpfanficarchive.com"
@@ -1,15 +1,21 @@
+import logging
 import re
 from random import randint
 
-from lxml import html
+from lxml import etree
 
 from ffn_bot import bot_tools
 from ffn_bot import site
 from ffn_bot.cache import default_cache
-from ffn_bot.metaparse import Metaparser, parser
+from ffn_bot.htmlparse import parse_until
+from ffn_bot.metaparse import Metaparser, parser, shared
+from ffn_bot.titleindex import default_index
 
 __all__ = ["FanfictionNetSite", "FictionPressSite"]
 
+STAT_SEPARATOR_REGEX = re.compile(r"\s+-\s+")
+STAT_NAME_REGEX = re.compile(r":\s+")
+
 LINK_REGEX = "http(s?)://((www|m)\\.)?%s/s/(?P<sid>\\d+).*"
 ID_LINK = "https://www.{0}/s/%s"
 
@@ -20,6 +26,14 @@ FFN_GENRES = [
     "Suspense", "Tragedy", "Western"
 ]
 
+FFN_TITLE = etree.XPath('//*[@id="profile_top"]/b/text()')
+FFN_SUMMARY = etree.XPath('//*[@id="profile_top"]/div/text()')
+FFN_AUTHOR_NAME = etree.XPath('//*[@id="profile_top"]/a[1]/text()')
+FFN_AUTHOR_URL = etree.XPath('//*[@id="profile_top"]/a[1]/@href')
+
+# The chapter text follows the metadata.
+FFN_STORY_TEXT = re.compile(r"""id=["']?storytext\b""")
+
 DOMAIN_TO_ARCHIVE_NAME = {
     "fanfiction.net": "fanfiction.net",
     "fictionpress.com": "FictionPress"
@@ -29,29 +43,35 @@ DOMAIN_TO_ARCHIVE_NAME = {
 class FanfictionParser(Metaparser):
     CATEGORY_TYPE = "Category"
 
-    @staticmethod
-    def get_story_information(tree):
-        if tree.xpath('//*[@id="profile_top"]/span[1]/img'):
-            return "".join(
-                tree.xpath('//*[@id="profile_top"]/span[4]//text()'))
+    IMAGE_XPATH = '//*[@id="profile_top"]/span[1]/img'
+    INFORMATION_XPATH = '//*[@id="profile_top"]/span[3]//text()'
+    INFORMATION_WITH_IMAGE_XPATH = '//*[@id="profile_top"]/span[4]//text()'
+    CATEGORY_XPATH = '//*[@id="pre_story_links"]/span/a[last()]/text()'
+
+    @classmethod
+    @shared
+    def get_story_information(cls, tree):
+        if cls.IMAGE_XPATH(tree):
+            return "".join(cls.INFORMATION_WITH_IMAGE_XPATH(tree))
         else:
-            return "".join(
-                tree.xpath('//*[@id="profile_top"]/span[3]//text()'))
+            return "".join(cls.INFORMATION_XPATH(tree))
+
+    @classmethod
+    @shared
+    def get_story_parts(cls, tree):
+        return [
+            STAT_NAME_REGEX.split(part)
+            for part in STAT_SEPARATOR_REGEX.split(cls.get_story_information(tree))]
 
     @parser
     @classmethod
     def parse_category(cls, id, tree):
-        return (
-            cls.CATEGORY_TYPE, tree.xpath(
-                '//*[@id="pre_story_links"]/span/a[last()]/text()')[0]
-        )
+        return (cls.CATEGORY_TYPE, cls.CATEGORY_XPATH(tree)[0])
 
     @parser
     @classmethod
     def parse_metadata_simple(cls, id, tree):
-        story_info = cls.get_story_information(tree)
-        for part in re.split(r"\s+-\s+", story_info):
-            subparts = re.split(r":\s+", part)
+        for subparts in cls.get_story_parts(tree):
             if len(subparts) == 2:
                 yield subparts
 
@@ -59,9 +79,7 @@ class FanfictionParser(Metaparser):
     @classmethod
     def parse_unnamed_parts(cls, id, tree):
         n_unnamed = 0
-        story_info = cls.get_story_information(tree)
-        for part in re.split(r"\s+-\s+", story_info):
-            subparts = re.split(r":\s+", part)
+        for subparts in cls.get_story_parts(tree):
             if len(subparts) == 2:
                 continue
 
@@ -104,7 +122,7 @@ class FanfictionBaseSite(site.Site):
         try:
             link = self.find_link(request, context)
         except (StopIteration, Exception):
-            bot_tools.print_exception()
+            logging.exception("(FFN) Could not find %s", request)
             return None
 
         if link is None:
@@ -113,7 +131,7 @@ class FanfictionBaseSite(site.Site):
         try:
             return self.generate_response(link, context)
         except Exception:
-            bot_tools.print_exception()
+            logging.exception("(FFN) Could not create the story of %s", link)
             return None
 
     def generate_response(self, link, context):
@@ -135,7 +153,7 @@ class FanfictionBaseSite(site.Site):
             return fic_name
 
         search_request = 'site:www.{1}/s/ {0}'.format(fic_name, self.site)
-        return default_cache.search(search_request)
+        return default_index.resolve(self.site, fic_name, search_request)
 
     def extract_direct_links(self, body, context):
         return (
@@ -146,6 +164,8 @@ class FanfictionBaseSite(site.Site):
 
 class Story(site.Story):
 
+    __slots__ = ("site", "parser")
+
     def __init__(self, url, site, context, parser):
         super(Story, self).__init__(context)
         self.url = url
@@ -160,35 +180,30 @@ class Story(site.Story):
         self.parser = parser
 
     def get_url(self):
-        return "https://www.%s/s/%s/1/" % (
-            self.site,
-            re.match(LINK_REGEX % self.site, self.url).groupdict()["sid"])
+        return "https://www.%s/s/%s/1/" % (self.site, self._story_id())
 
     def parse_html(self):
         page = default_cache.get_page(
             self.get_url(),
-            throttle=randint(1000, 4000) / 1000)
-        tree = html.fromstring(page)
-        print("got page")
+            throttle=randint(1000, 4000) / 1000,
+            stop=FFN_STORY_TEXT)
+        tree = parse_until(page, FFN_STORY_TEXT)
 
-        self.title = (tree.xpath('//*[@id="profile_top"]/b/text()'))
-        print('title', self.title)
+        self.title = FFN_TITLE(tree)
         if not len(self.title):
             raise site.StoryDoesNotExist
         self.title = self.title[0]
-        self.summary = (tree.xpath('//*[@id="profile_top"]/div/text()'))[0
-        ]
-        print('summary', self.summary)
-        self.author += (tree.xpath('//*[@id="profile_top"]/a[1]/text()'))[
-            0
-        ]
-        print('author', self.author)
-        self.authorlink = 'https://www.' + self.site + tree.xpath(
-            '//*[@id="profile_top"]/a[1]/@href')[0]
-        print('alink', self.authorlink)
-        self.image = tree.xpath('//*[@id="profile_top"]/span[1]/img')
-        self.tree = tree
+        self.summary = FFN_SUMMARY(tree)[0]
+        self.author += FFN_AUTHOR_NAME(tree)[0]
+        self.authorlink = 'https://www.' + self.site + FFN_AUTHOR_URL(tree)[0]
         self.stats = self.parser(None, tree)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("(FFN) Parsed %r by %s", self.title, self.author, extra={
+                "site": self.site, "story_id": self._story_id(), "title": self.title,
+                "author": self.author, "authorlink": self.authorlink, "summary": self.summary})
+
+    def _story_id(self):
+        return re.match(LINK_REGEX % self.site, self.url).groupdict()["sid"]
 
 
     def get_site(self):
@@ -3,12 +3,13 @@
 import logging
 import re
 
-from lxml import html
+from lxml import etree, html
 
 from ffn_bot import site
 from ffn_bot.bot_tools import safe_int
 from ffn_bot.cache import default_cache
 from ffn_bot.metaparse import Metaparser, parser
+from ffn_bot.titleindex import default_index
 from ffn_bot.site import Site
 
 __all__ = ["SinkIntoYourEyes"]
@@ -18,9 +19,9 @@ SIYE_LINK_REGEX = re.compile(
 SIYE_FUNCTION = "linksiye"
 SIYE_SEARCH_QUERY = "http://www.siye.co.uk/viewstory.php?sid=%s"
 
-SIYE_AUTHOR_URL = '//html/body/table/tr/td/table/tr[1]/td[1]/h3[1]//@href'
-SIYE_SUMMARY_AND_META = '//html/body/table/tr/td/table/tr[2]/td[1]//text()'
-SIYE_TITLE_AUTHOR_NAME = '//html/body/table/tr/td/table/tr[1]/td[1]/h3[1]//text()'
+SIYE_AUTHOR_URL = etree.XPath('//html/body/table/tr/td/table/tr[1]/td[1]/h3[1]//@href')
+SIYE_SUMMARY_AND_META = etree.XPath('//html/body/table/tr/td/table/tr[2]/td[1]//text()')
+SIYE_TITLE_AUTHOR_NAME = etree.XPath('//html/body/table/tr/td/table/tr[1]/td[1]/h3[1]//text()')
 
 
 
@@ -29,7 +30,7 @@ class SIYEMetadata(Metaparser):
     @parser
     @staticmethod
     def parse_metadata(id, tree):
-        summary_and_meta = ' '.join(tree.xpath(SIYE_SUMMARY_AND_META))
+        summary_and_meta = ' '.join(SIYE_SUMMARY_AND_META(tree))
         stats = summary_and_meta
         stats = re.sub("Story Total: ", "",stats.replace("Awards:  View Trophy Room",""))
         if "Story is Complete" in stats:
@@ -98,7 +99,8 @@ class SinkIntoYourEyes(Site):
         if match is not None:
             return request
 
-        return default_cache.search(SIYE_SEARCH_QUERY % id)
+        return default_index.resolve(
+            "siye.co.uk", request, SIYE_SEARCH_QUERY % request)
 
     def generate_response(self, link, context):
         assert link is not None
@@ -116,17 +118,17 @@ class SinkIntoYourEyes(Site):
 
 class Story(site.Story):
 
+    __slots__ = ()
+
     def __init__(self, url, context=None):
         super(Story, self).__init__(context)
         self.url = url
-        self.raw_stats = []
 
         self.stats = ""
         self.title = ""
         self.author = ""
         self.authorlink = ""
         self.summary = ""
-        self.summary_and_meta = ""
 
     def get_url(self):
         return SinkIntoYourEyes.id_to_url(
@@ -134,25 +136,25 @@ class Story(site.Story):
         )
 
     def parse_html(self):
-        self.tree = tree = html.fromstring(default_cache.get_page(self.url))
+        tree = html.fromstring(default_cache.get_page(self.url))
 
-        self.summary_and_meta = ' '.join(tree.xpath(SIYE_SUMMARY_AND_META))
+        summary_and_meta = ' '.join(SIYE_SUMMARY_AND_META(tree))
         self.summary = ''.join(
             re.findall(
                 'Summary: (.*?)(?=Hitcount:)',
-                self.summary_and_meta,
+                summary_and_meta,
                 re.DOTALL
             )
         ).replace("\n", " ").strip()
         self.stats = SIYEMetadata(
             str(SIYE_LINK_REGEX.match(self.url).groupdict()["sid"]),
-            self.tree
-
+            tree
         )
-        self.title = tree.xpath(SIYE_TITLE_AUTHOR_NAME)[0]
-        self.author = tree.xpath(SIYE_TITLE_AUTHOR_NAME)[2]
+        title_author_name = SIYE_TITLE_AUTHOR_NAME(tree)
+        self.title = title_author_name[0]
+        self.author = title_author_name[2]
         self.authorlink = 'http://www.siye.co.uk/' + \
-                          tree.xpath(SIYE_AUTHOR_URL)[0]
+                          SIYE_AUTHOR_URL(tree)[0]
 
     def get_site(self):
         return "Sink Into Your Eyes", "http://www.siye.co.uk"
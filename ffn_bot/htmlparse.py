@@ -0,0 +1,44 @@
+"""
+Parses only the part of a page we actually read.
+
+The story pages contain the whole first chapter, but the metadata
+is always in front of it. The parser is fed the page up to the
+beginning of the story text, so the chapter is never parsed.
+"""
+from lxml import html
+
+
+def cut_before(page, stop):
+    """
+    Returns the part of the page in front of the stop pattern.
+
+    :param page:  The html of the page.
+    :param stop:  A compiled regular expression matching inside the
+                  first tag that is not needed.
+    :returns: The page up to the tag containing the match, or the
+              whole page if the pattern is not found.
+    """
+    match = stop.search(page)
+    if match is None:
+        return page
+
+    # Cut before the tag containing the match, so no half tag is kept.
+    end = page.rfind("<", 0, match.start())
+    if end <= 0:
+        return page
+    return page[:end]
+
+
+def parse_until(page, stop):
+    """
+    Parses the page until the stop pattern is found.
+
+    :param page:  The html of the page.
+    :param stop:  A compiled regular expression matching inside the
+                  first tag that does not have to be parsed.
+    :returns: The root element of the parsed part.
+    """
+    parser = html.HTMLParser()
+    parser.feed(cut_before(page, stop))
+    # The parser closes all elements that are still open.
+    return parser.close()
@@ -0,0 +1,150 @@
+"""
+Structured logging of the bot.
+
+Records are written as JSON lines (or plain text) by a background
+thread, so the threads handling posts never wait for the log output.
+Fields bound with context() (e.g. the request id) are added to every
+record logged inside the with-block, including the records of the
+prefetch threads.
+"""
+import atexit
+import contextlib
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(threadName)s %(message)s"
+
+# The attributes every LogRecord has. Everything else was passed
+# with extra= and is written as a field.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "taskName"}
+
+_context = contextvars.ContextVar("log_context", default={})
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def context(**fields):
+    """
+    Adds the fields to all records logged inside the with-block.
+
+    :param fields:  The fields. (e.g. request_id="t1_abc")
+    """
+    token = _context.set(dict(_context.get(), **fields))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the fields of the current context to the record."""
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as a single line of JSON."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # The arguments may change once we return, so the message is
+        # merged here. Serializing the record is left to the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup(level=logging.INFO, format="json", path=None):
+    """
+    Sends all records through a queue to a background thread.
+
+    Calling it again only changes the level.
+
+    :param level:   The level of the root logger.
+    :param format:  "json" or "text".
+    :param path:    The file to log to. (stderr if empty)
+    """
+    global _listener, _handler
+    root = logging.getLogger()
+    root.setLevel(level)
+
+    with _lock:
+        if _listener is not None:
+            return
+
+        if path:
+            output = logging.FileHandler(path, encoding="utf-8")
+        else:
+            output = logging.StreamHandler(sys.stderr)
+        if format == "json":
+            output.setFormatter(JSONFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        records = queue.SimpleQueue()
+        _handler = _QueueHandler(records)
+        _handler.addFilter(ContextFilter())
+        _listener = logging.handlers.QueueListener(records, output)
+        _listener.start()
+        root.addHandler(_handler)
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Writes the remaining records and stops the background thread."""
+    global _listener, _handler
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_handler)
+        _listener.stop()
+        _listener = _handler = None
+
+
+def configure(section, level=logging.INFO):
+    """
+    Configures the logging using the [Logging]-section of the config file.
+
+    :param section:  The section of the config file.
+    :param level:    The level given on the command line.
+    """
+    setup(level, section.get("format", "json").strip().lower(), section.get("path", "").strip())
@@ -2,11 +2,16 @@
 I want a nicer implementation of some parsers.
 """
 import collections
+import functools
 import inspect
+import threading
 
 basestring = (str, bytes)
 MetadataItem = collections.namedtuple("MetadataItem", "name value")
 
+# Results shared between the parsers of a single parse.
+_parse_state = threading.local()
+
 
 class MetaparserMeta(type):
     """
@@ -22,28 +27,39 @@ class MetaparserMeta(type):
     def __new__(cls, name, bases, what):
         result = super(MetaparserMeta, cls).__new__(cls, name, bases, what)
 
+        # Compile the XPaths of the class once instead of on every parse.
+        for k, v in what.items():
+            if k.endswith("_XPATH") and isinstance(v, basestring):
+                from lxml import etree
+                setattr(result, k, etree.XPath(v))
+
         # Find all parsers
-        parsers = []
-        for base in result.mro():
-            for parser in getattr(base, "_parsers", ()):
-                if parser not in parsers:
-                    parsers.append(parser)
+        names = []
+        for base in reversed(result.mro()[1:]):
+            for parser_name in getattr(base, "_parser_names", ()):
+                if parser_name not in names:
+                    names.append(parser_name)
 
         # Add all newly implemented parsers.
         for k, v in what.items():
-            if hasattr(v, "_parser") and v._parser:
-                parsers.append(getattr(result, k))
-        result._parsers = parsers
+            if hasattr(v, "_parser") and v._parser and k not in names:
+                names.append(k)
+        result._parser_names = names
+
+        # Bind the parsers to this class, so they see its attributes,
+        # and check once which of them are generators.
+        result._parsers = [
+            (getattr(result, k), inspect.isgeneratorfunction(getattr(result, k)))
+            for k in names]
 
         # Return the new class.
         return result
 
 
-def _apply_generator(func, *args, **kwargs):
-    result = func(*args, **kwargs)
-    if inspect.isgenerator(result):
-        for item in result:
-            yield item
+def _apply_parser(func, is_generator, *args):
+    result = func(*args)
+    if is_generator:
+        yield from result
     elif (
             (not isinstance(result, collections.abc.Sequence))
             or len(result) != 2
@@ -63,9 +79,14 @@ class Metaparser(metaclass=MetaparserMeta):
     def __new__(cls, id, tree):
         result = collections.OrderedDict()
 
-        for parser in cls._parsers:
-            for name, value in _apply_generator(parser, id, tree):
-                result[name] = value
+        previous = getattr(_parse_state, "memo", None)
+        _parse_state.memo = {}
+        try:
+            for parser, is_generator in cls._parsers:
+                for name, value in _apply_parser(parser, is_generator, id, tree):
+                    result[name] = value
+        finally:
+            _parse_state.memo = previous
 
         return result
 
@@ -86,3 +107,20 @@ class Metaparser(metaclass=MetaparserMeta):
 def parser(func):
     func._parser = True
     return func
+
+
+def shared(func):
+    """
+    Remembers the result of a helper while the parsers of one
+    parse are running, so parsers can share intermediate results.
+    """
+    @functools.wraps(func)
+    def _wrapper(*args):
+        memo = getattr(_parse_state, "memo", None)
+        if memo is None:
+            return func(*args)
+        key = (_wrapper,) + args
+        if key not in memo:
+            memo[key] = func(*args)
+        return memo[key]
+    return _wrapper
@@ -0,0 +1,265 @@
+"""
+Metrics of the hot paths in the Prometheus text format.
+
+Nothing is recorded until the metrics are enabled, so disabled
+metrics only cost a single check per call. When enabled, the
+metrics are served on /metrics by a small HTTP server.
+"""
+import contextlib
+import logging
+import math
+import threading
+import time
+
+# Buckets of the latency histograms in seconds.
+TIME_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+# Buckets of the page size histogram in bytes.
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{0}="{1}"'.format(
+            k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels) + "}"
+
+
+class Registry(object):
+    """
+    Holds all metrics.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self.register(Counter(self, name, help))
+
+    def gauge(self, name, help):
+        return self.register(Gauge(self, name, help))
+
+    def histogram(self, name, help, buckets=TIME_BUCKETS):
+        return self.register(Histogram(self, name, help, buckets))
+
+    def render(self):
+        """Returns all metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP {0} {1}".format(metric.name, metric.help))
+            lines.append("# TYPE {0} {1}".format(metric.name, metric.type))
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, registry, name, help):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        with self._lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield "{0}{1} {2}".format(self.name, _format_labels(labels), _format_value(value))
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that can go up and down."""
+    type = "gauge"
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = value
+
+
+class _Timer(object):
+    __slots__ = ("histogram", "labels", "clock", "start")
+
+    def __init__(self, histogram, clock, labels):
+        self.histogram = histogram
+        self.clock = clock
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = self.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(self.clock() - self.start, **self.labels)
+
+
+class Histogram(Metric):
+    """Counts the observed values in buckets."""
+    type = "histogram"
+
+    def __init__(self, registry, name, help, buckets=TIME_BUCKETS):
+        super(Histogram, self).__init__(registry, name, help)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self.values.get(key, (None, 0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.values[key] = (counts, total + value)
+
+    def timer(self, clock=time.perf_counter, **labels):
+        """
+        Observes the time spent in the with-block.
+
+        :param clock:  The clock to use. (time.thread_time for CPU time)
+        """
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, clock, labels)
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield "{0}_bucket{1} {2}".format(
+                    self.name, _format_labels(labels + (("le", _format_value(bound)),)), cumulative)
+            yield "{0}_sum{1} {2}".format(self.name, _format_labels(labels), _format_value(total))
+            yield "{0}_count{1} {2}".format(self.name, _format_labels(labels), cumulative)
+
+
+registry = Registry()
+
+# Streams
+POSTS = registry.counter(
+    "ffnbot_posts_total", "Streamed posts by stream and whether they were queued.")
+QUEUE_DEPTH = registry.gauge(
+    "ffnbot_queue_depth", "Posts waiting for a free handler.")
+QUEUE_WAIT = registry.histogram(
+    "ffnbot_queue_wait_seconds", "Time posts waited for a handler.")
+HANDLE_TIME = registry.histogram(
+    "ffnbot_handle_seconds", "Time spent handling a post.")
+
+# Resolving and loading stories
+RESOLVE_TIME = registry.histogram(
+    "ffnbot_resolve_seconds", "Time spent finding the stories of a request by site.")
+TITLE_INDEX = registry.counter(
+    "ffnbot_title_index_total", "Title lookups answered by the local index or a search.")
+CACHE_REQUESTS = registry.counter(
+    "ffnbot_cache_requests_total", "Cache lookups by namespace and result.")
+SEARCH_TIME = registry.histogram(
+    "ffnbot_search_seconds", "Time spent on uncached searches.")
+PAGE_LOAD_TIME = registry.histogram(
+    "ffnbot_page_load_seconds", "Time spent loading uncached pages by domain.")
+PAGE_SIZE = registry.histogram(
+    "ffnbot_page_size_bytes", "Size of the loaded pages by domain.", SIZE_BUCKETS)
+PARSE_CPU = registry.histogram(
+    "ffnbot_parse_cpu_seconds", "CPU time spent parsing a story by site.")
+RENDER_TIME = registry.histogram(
+    "ffnbot_render_seconds", "Time spent rendering a story by site.")
+
+# Reddit
+REDDIT_TIME = registry.histogram(
+    "ffnbot_reddit_seconds", "Time spent on reddit lookups by call.")
+REPLIES = registry.counter(
+    "ffnbot_replies_total", "Replies by result.")
+REPLY_SEND_TIME = registry.histogram(
+    "ffnbot_reply_send_seconds", "Time reddit took to accept a reply.")
+OUTBOX_PENDING = registry.gauge(
+    "ffnbot_outbox_pending", "Replies waiting to be sent.")
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_server(port, host="127.0.0.1"):
+    """
+    Serves the metrics on http://host:port/metrics.
+
+    The server is only started once.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+        # Only import the http server when the metrics are enabled.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        _server = ThreadingHTTPServer((host, port), _Handler)
+        _server.daemon_threads = True
+        thread = threading.Thread(target=_server.serve_forever, name="metrics")
+        thread.daemon = True
+        thread.start()
+        logging.info("(Metrics) Serving metrics on http://{0}:{1}/metrics".format(host, port))
+        return _server
+
+
+def configure(section):
+    """
+    Configures the metrics using the [Metrics]-section of the config file.
+
+    :param section:  The section of the config file.
+    """
+    if section.get("enabled", "false").lower() != "true":
+        return
+    registry.enabled = True
+    start_server(int(section.get("port", 9108)), section.get("host", "127.0.0.1"))
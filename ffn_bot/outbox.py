@@ -0,0 +1,182 @@
+"""
+Paces the replies of the bot.
+
+Replies are queued and sent by a background thread, so handling
+the next post does not have to wait for the earlier replies.
+"""
+import logging
+import re
+import threading
+import time
+from queue import Queue
+
+from ffn_bot import metrics
+
+RATELIMIT_REGEX = re.compile(r"(\d+)\s+(minute|second)", re.IGNORECASE)
+
+
+class TokenBucket(object):
+    """
+    A simple token bucket.
+
+    Tokens are refilled continuously at the given rate up to the
+    size of the burst.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate:   The number of tokens per second.
+        :param burst:  The maximum number of tokens.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self):
+        """Waits until a token is available and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def block(self, seconds):
+        """Hands out no tokens for the given time and empties the bucket."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+def get_ratelimit_delay(exc):
+    """
+    Returns the time in seconds reddit wants us to wait, or None if
+    the exception is not caused by reddits rate limit.
+    """
+    # praw >= 7 bundles multiple errors in one exception.
+    items = getattr(exc, "items", None) or [exc]
+    for item in items:
+        if getattr(item, "error_type", None) != "RATELIMIT":
+            continue
+        match = RATELIMIT_REGEX.search(getattr(item, "message", "") or "")
+        if match is None:
+            return 60
+        amount = int(match.group(1))
+        if match.group(2).lower() == "minute":
+            amount *= 60
+        return amount
+    return None
+
+
+class ReplyScheduler(object):
+    """
+    Sends the queued replies in order.
+    """
+
+    def __init__(self, rate=6 / 60, burst=3, max_retries=3):
+        """
+        :param rate:         The number of replies per second.
+        :param burst:        The number of replies that may be sent at once.
+        :param max_retries:  How often a rate limited reply is tried again.
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.queue = Queue()
+        self._thread = None
+
+    def start(self):
+        """Starts the sender thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="outbox")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, obj, message, callback=None):
+        """
+        Queues a reply.
+
+        :param obj:       The object to reply to.
+        :param message:   The text of the reply.
+        :param callback:  Called with the sent reply.
+        """
+        self.start()
+        self.queue.put((obj, message, callback))
+        metrics.OUTBOX_PENDING.set(self.queue.qsize())
+
+    def call_after(self, callback):
+        """
+        Calls the function once all replies queued so far are sent.
+
+        :param callback:  Called without arguments.
+        """
+        self.start()
+        self.queue.put((None, None, callback))
+        metrics.OUTBOX_PENDING.set(self.queue.qsize())
+
+    def pending(self):
+        """Returns the number of replies waiting to be sent."""
+        return self.queue.qsize()
+
+    def _run(self):
+        while True:
+            obj, message, callback = self.queue.get()
+            metrics.OUTBOX_PENDING.set(self.queue.qsize())
+            if obj is None:
+                self._call(callback)
+                continue
+            try:
+                self._send(obj, message, callback)
+            except Exception:
+                metrics.REPLIES.inc(result="failed")
+                logging.exception("(Outbox) Could not reply to %s", obj)
+
+    def _call(self, callback):
+        try:
+            callback()
+        except Exception:
+            logging.exception("(Outbox) Callback failed")
+
+    def _send(self, obj, message, callback):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                with metrics.REPLY_SEND_TIME.timer():
+                    reply = obj.reply(message)
+            except Exception as e:
+                delay = get_ratelimit_delay(e)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                metrics.REPLIES.inc(result="ratelimited")
+                logging.warning("(Outbox) Rate limited. Waiting {0} seconds.".format(delay))
+                self.bucket.block(delay)
+                continue
+
+            metrics.REPLIES.inc(result="sent")
+            if callback is not None:
+                callback(reply)
+            return
+
+    def configure(self, section):
+        """
+        Configures the scheduler using the [Reddit]-section of the config file.
+
+        :param section:  The section of the config file.
+        """
+        self.bucket.rate = float(section.get("reply_rate", self.bucket.rate * 60)) / 60
+        self.bucket.burst = int(section.get("reply_burst", self.bucket.burst))
+
+
+default_outbox = ReplyScheduler()
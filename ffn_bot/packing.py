@@ -0,0 +1,37 @@
+"""
+Packs rendered parts into replies.
+
+Reddit limits the length of a comment, so long replies are split
+into multiple comments. The parts are never split themselves.
+"""
+
+
+def pack(items, max_length, length=len):
+    """
+    Groups the items into chunks whose total length does not
+    exceed max_length.
+
+    The items keep their order. An item that does not fit into the
+    current chunk starts the next one, an item longer than max_length
+    gets a chunk of its own.
+
+    :param items:       An iterable of items.
+    :param max_length:  The maximum total length of a chunk.
+    :param length:      Returns the length of an item.
+    :returns: A generator of lists of items.
+    """
+    chunk = []
+    total = 0
+    for item in items:
+        item_length = length(item)
+        if chunk and total + item_length > max_length:
+            yield chunk
+            chunk = []
+            total = 0
+
+        chunk.append(item)
+        total += item_length
+
+    if chunk:
+        yield chunk
+
@@ -1,5 +1,8 @@
 from .parser import parser, RequestParser
-from ..fetchers import SITES
+from .. import fetchers
+from .. import metrics
+from ..prefetch import map_ordered
+from .scanner import scan
 
 
 @RequestParser.register(100)
@@ -11,20 +14,19 @@ def standard_requests(request):
     :param request:   The request.
     :return:          True.
     """
-    for site in SITES:
-        matches = site.regex.findall(request.content)
+    jobs = scan(request.content).requests
 
-        # Split the request list using semicolons.
-        request_list = []
-        for item in matches:
-            request_list.extend(item.split(";"))
+    def _resolve(job):
+        site, item = job
+        with metrics.RESOLVE_TIME.timer(site=site.command):
+            return list(site.from_requests([item], request.markers))
 
-        # Ensure we don't have empty request lists.
-        if not request_list:
-            continue
+    # Resolve the requests concurrently, bounding the searches per site.
+    results = map_ordered(_resolve, jobs, lambda job: job[0].name)
 
-        # Add each story to the request.
-        for story in site.from_requests(request_list, request.markers):
+    # Add each story to the request.
+    for stories in results:
+        for story in stories:
             if story is None:
                 continue
             request.stories.append(story)
@@ -43,8 +45,9 @@ def direct_links(request):
     :param request: The request.
     :return: True.
     """
-    for site in SITES:
-        request.stories.extend(site.extract_direct_links(request.content, request.markers))
+    for link in scan(request.content).links:
+        for site in fetchers.registry.all():
+            request.stories.extend(site.extract_direct_links(link, request.markers))
     return True
 
 
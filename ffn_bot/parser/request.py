@@ -2,6 +2,7 @@
 import re
 
 from .parser import RequestParser
+from .scanner import MARKER_PATTERN, scan
 
 
 class Request(object):
@@ -16,7 +17,7 @@ class Request(object):
     # ffnbot!ignore              Ignore the comment entirely
     # ffnbot!distinct:false      Don't make sure that we get distinct requests
     # ffnbot!directlinks         Also extract story requests from direct links
-    CONTEXT_MARKER_REGEX = re.compile(r"ffnbot!([A-Za-z]+)")
+    CONTEXT_MARKER_REGEX = re.compile(MARKER_PATTERN)
 
     def __init__(self, request, markers=None):
         self.request = request
@@ -89,7 +90,7 @@ class Request(object):
         :param comment: The comment to parse.
         :return: Yields a tuple for each entry inside the context marker.
         """
-        for entry in self.CONTEXT_MARKER_REGEX.findall(self.content):
+        for entry in scan(self.content).markers:
             for marker in entry.split(","):
                 if ":" not in marker:
                     yield (marker, None)
@@ -0,0 +1,118 @@
+"""
+Single pass extraction of requests, direct links and markers.
+
+Instead of running the regular expression of every site over the
+comment, all sites are merged into one regular expression that
+finds everything in one scan.
+"""
+import collections
+import functools
+import re
+import threading
+
+# The context markers. (ffnbot!ignore, ...)
+MARKER_PATTERN = r"ffnbot!([A-Za-z]+)"
+# Links that might point to a story.
+LINK_PATTERN = r"https?://[^\s()\[\]<>]+"
+# Commands that are not implemented by a site.
+EXTRA_COMMANDS = ("linksub",)
+
+ScanResult = collections.namedtuple("ScanResult", "requests links markers")
+
+
+class RequestScanner(object):
+    """
+    Finds the requests of all sites, the links and the markers
+    of a comment in one pass.
+    """
+
+    def __init__(self, commands, get_site):
+        """
+        :param commands:  The commands of the sites in the order
+                          their requests are answered.
+        :param get_site:  Returns the site of a command. Only called
+                          for commands that were found.
+        """
+        self.commands = [command.lower() for command in commands]
+        self.get_site = get_site
+
+        # Longer commands first, so no command shadows another one.
+        commands = sorted(self.commands, key=len, reverse=True)
+        self.regex = re.compile(
+            r"(?i:(?P<command>%s))\((?P<items>.*?)\)|%s|(?P<link>%s)" % (
+                "|".join(re.escape(c) for c in commands),
+                MARKER_PATTERN.replace("(", "(?P<marker>", 1),
+                LINK_PATTERN))
+
+        # Every request and every marker contains one of these.
+        self.prefilter = re.compile(r"(?i:%s)\(|ffnbot!" % "|".join(
+            re.escape(c) for c in sorted(
+                set(commands) | set(EXTRA_COMMANDS), key=len, reverse=True)))
+
+    def might_contain_request(self, content):
+        """
+        Cheap check if the content might contain a request or a marker.
+
+        :param content:  The comment body.
+        :returns: False if the content can be ignored.
+        """
+        return self.prefilter.search(content) is not None
+
+    def scan(self, content):
+        """
+        Scans the content.
+
+        :param content:  The comment body.
+        :returns: A ScanResult containing the (site, item)-tuples of the
+                  requests in the order of the sites, the links and the
+                  markers in the order of the comment.
+        """
+        by_site = collections.defaultdict(list)
+        links = []
+        markers = []
+
+        for match in self.regex.finditer(content):
+            command = match.group("command")
+            if command is not None:
+                by_site[command.lower()].extend(match.group("items").split(";"))
+            elif match.group("marker") is not None:
+                markers.append(match.group("marker"))
+            else:
+                links.append(match.group("link"))
+
+        requests = []
+        for command in self.commands:
+            if command in by_site:
+                site = self.get_site(command)
+                requests.extend((site, item) for item in by_site[command])
+        return ScanResult(tuple(requests), tuple(links), tuple(markers))
+
+
+_scanner = None
+_scanner_lock = threading.Lock()
+
+
+def get_scanner():
+    """Returns the scanner for all sites of the manifest."""
+    global _scanner
+    with _scanner_lock:
+        if _scanner is None:
+            from ..fetchers import registry
+            _scanner = RequestScanner(registry.commands(), registry.get)
+        return _scanner
+
+
+def might_contain_request(content):
+    """Checks if the content might contain a request or a marker."""
+    return get_scanner().might_contain_request(content)
+
+
+@functools.lru_cache(maxsize=64)
+def scan(content):
+    """
+    Scans the content of a comment.
+
+    The result is cached as the same body is usually scanned for
+    its markers first and for its requests afterwards.
+    """
+    return get_scanner().scan(content)
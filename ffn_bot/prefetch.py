@@ -0,0 +1,144 @@
+"""
+Concurrent resolving and loading of stories.
+"""
+import collections
+import contextvars
+import functools
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from ffn_bot import site
+
+# The number of stories that are loaded at the same time.
+PREFETCH_WORKERS = 8
+# The number of requests that are sent to the same site at the same time.
+PREFETCH_PER_DOMAIN = 2
+
+_executor = None
+_lock = threading.Lock()
+# The number of running items and the waiting items by key.
+_running = collections.Counter()
+_waiting = {}
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=PREFETCH_WORKERS,
+                thread_name_prefix="prefetch")
+        return _executor
+
+
+def story_domain(story):
+    """Returns the domain the story is loaded from."""
+    try:
+        return urlparse(story.get_url()).netloc.lower()
+    except Exception:
+        return None
+
+
+def submit(func, key=None):
+    """
+    Runs the function on the shared pool.
+
+    Only PREFETCH_PER_DOMAIN functions of the same key run at the same
+    time. The others wait outside of the pool, so they never hold a
+    worker that another site could use.
+
+    :param func:  The function to run. (Without arguments)
+    :param key:   The concurrency slot of the function. (Usually the
+                  domain of the site, None for no limit.)
+    :returns: A Future of the result.
+    """
+    future = Future()
+    with _lock:
+        start = key is None or _running[key] < PREFETCH_PER_DOMAIN
+        if start:
+            _running[key] += 1
+        else:
+            _waiting.setdefault(key, collections.deque()).append((future, func))
+    if start:
+        _start(future, func, key)
+    return future
+
+
+def _start(future, func, key):
+    def _run():
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func())
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            _release(key)
+    _get_executor().submit(_run)
+
+
+def _release(key):
+    with _lock:
+        waiting = _waiting.get(key)
+        if not waiting:
+            _running[key] -= 1
+            if not _running[key]:
+                del _running[key]
+            return
+        # Hand the slot to the next waiting item of the key.
+        future, func = waiting.popleft()
+        if not waiting:
+            del _waiting[key]
+    _start(future, func, key)
+
+
+def map_ordered(func, items, key=None):
+    """
+    Applies the function to all items concurrently.
+
+    :param func:  The function to apply.
+    :param items: The items.
+    :param key:   A function returning the concurrency slot of the item.
+    :returns: A list with the results in the order of the items.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+
+    # Run every item in a copy of our context, so the workers log the
+    # fields of the request they are working on.
+    futures = [
+        submit(functools.partial(contextvars.copy_context().run, func, item),
+               None if key is None else key(item))
+        for item in items]
+    return [future.result() for future in futures]
+
+
+def _load_story(story):
+    try:
+        story.load()
+    except Exception:
+        # The error will be reported when the story is rendered.
+        pass
+
+
+def prefetch_stories(stories):
+    """
+    Loads all given stories concurrently.
+
+    :param stories:  An iterable of stories.
+    """
+    pending = []
+    seen = set()
+    for story in stories:
+        if not isinstance(story, site.Story) or id(story) in seen:
+            continue
+        if story._loaded or story._load_error is not None:
+            continue
+        seen.add(id(story))
+        pending.append(story)
+
+    logging.debug("Prefetching %d stories", len(pending))
+    map_ordered(_load_story, pending, story_domain)
@@ -5,17 +5,27 @@ import logging
 import re
 import sys
 import time
-from queue import Queue
-from threading import Thread
+from collections import OrderedDict
+from threading import Lock
 
 import praw
-from praw.models import Submission
+from praw.models import MoreComments, Submission
 
-from ffn_bot import bot_tools
+from ffn_bot import bot_tools, logs, metrics
+from ffn_bot.cache import default_cache
 from ffn_bot.commentparser import StoryLimitExceeded
-from ffn_bot.commentparser import formulate_reply, parse_context_markers
-from ffn_bot.reddit_markdown import remove_superscript
-from ffn_bot.state import Application
+from ffn_bot.commentparser import collect_stories, formulate_reply_parts, parse_context_markers
+from ffn_bot.engine import StreamEngine, PRIORITY_HIGH
+from ffn_bot.outbox import default_outbox
+from ffn_bot.packing import pack
+from ffn_bot.parser.scanner import might_contain_request
+from ffn_bot.prefetch import map_ordered
+from ffn_bot.site import Story, StoryRecord
+from ffn_bot.slim import MAX_COMMENT_LENGTH, PAYLOAD_OVERHEAD, attach_payload, distinct_records
+from ffn_bot.slim import payload_share, read_records, render_slim
+from ffn_bot.solver import default_client
+from ffn_bot.state import Application, ProcessedStore, Watermark
+from ffn_bot.titleindex import default_index
 
 
 def run_forever():
@@ -41,13 +51,16 @@ def load_config():
     global config, cli_args, r
     global USER_AGENT, DEFAULT_SUBREDDITS, SUBREDDIT_LIST, FOOTER, APPLICATION, \
         COUNT_REPLIES, COUNT_REPLIES_LIMIT, TIME_TO_RESET, TIME_SINCE_RESET, DRY_RUN, \
-        BOT_USERNAME, MIN_VALID_TIME
+        BOT_USERNAME, WATERMARK, PROCESSED, CONCURRENCY
     global __author__, __version__
 
     config = configparser.ConfigParser()
     cli_args = get_cli_args()
     config.read(cli_args['config_loc'])
 
+    level = getattr(logging, cli_args["verbosity"].upper())
+    logs.configure(config['Logging'] if config.has_section('Logging') else {}, level)
+
     __author__ = config['Metadata']['authors']
     __version__ = config['Metadata']['version']
     USER_AGENT = config['Metadata']['user_agent']
@@ -59,16 +72,33 @@ def load_config():
     COUNT_REPLIES_LIMIT = int(config['Reddit']['replies_limit'])
     TIME_TO_RESET = int(config['Reddit']['replies_reset'])
     TIME_SINCE_RESET = time.time()  # Time since the last dictionary reset
+    CONCURRENCY = int(config['Reddit'].get('concurrency', 4))  # Posts handled at the same time
+    default_outbox.configure(config['Reddit'])
     APPLICATION = Application()
 
+    if config.has_section('Cache'):
+        default_cache.configure(config['Cache'])
+        default_index.configure(config['Cache'])
+    if config.has_section('FlareSolverr'):
+        default_client.configure(config['FlareSolverr'])
+    if config.has_section('Metrics'):
+        metrics.configure(config['Metrics'])
+
     DRY_RUN = bool(cli_args["dry"])
     if DRY_RUN:
         logging.warning("Dry run enabled. No comment will be sent.")
 
-    level = getattr(logging, cli_args["verbosity"].upper())
-    logging.getLogger().setLevel(level)
     r = get_authenticated_instance()
-    MIN_VALID_TIME = last_comment_time()
+
+    # Only ask reddit for our last comment if we don't know it yet.
+    WATERMARK = Watermark(config.get('State', 'watermark', fallback=None))
+    if not WATERMARK.load():
+        WATERMARK.advance(last_comment_time())
+
+    # Posts we already handled, so restarts do not reply twice.
+    PROCESSED = ProcessedStore(
+        config.get('State', 'processed', fallback=None),
+        max_size=config.getint('State', 'processed_size', fallback=100000))
 
 
 def get_authenticated_instance():
@@ -85,6 +115,7 @@ def main():
     """Basic main function."""
     load_config()
     Application.reset()
+    Application().comments = PROCESSED
     load_subreddits()
     stream_strategy()
     sys.exit()
@@ -154,9 +185,8 @@ def load_subreddits():
 def last_comment_time():
     try:
         return time_created(next(r.redditor(BOT_USERNAME).comments.new(limit=1)))
-    except Exception as e:
-        print(e)
-        logging.fatal("Could not retrieve last bot comment! Please make a comment.")
+    except Exception:
+        logging.fatal("Could not retrieve last bot comment! Please make a comment.", exc_info=True)
         return datetime.datetime.min
 
 
@@ -169,6 +199,10 @@ def handle_submission(submission, markers=set()):
             logging.error(e)
 
 
+# Guards COUNT_REPLIES as messages are handled concurrently.
+_count_replies_lock = Lock()
+
+
 def handle_message(message, markers=set()):
     global COUNT_REPLIES, TIME_SINCE_RESET, TIME_TO_RESET, COUNT_REPLIES_LIMIT
     """What we're using to handle direct messages."""
@@ -187,10 +221,6 @@ def handle_message(message, markers=set()):
     except AttributeError:
         pass
 
-    # If enough time has elapsed, reset COUNT_REPLIES to an empty dict.
-    if time.time() - TIME_SINCE_RESET >= TIME_TO_RESET:
-        COUNT_REPLIES = {}
-
     # Count the number of requests in the body of the message, of format link...(...;...;...)
     request_count = message.body.count('link') + message.body.count(';')
     body = message.body
@@ -200,24 +230,29 @@ def handle_message(message, markers=set()):
         sub_recs = get_submission_recommendations(body)
         markers.add('slim')
 
-    # If the message author can not be found in the dict, add them.
-    COUNT_REPLIES.setdefault(message.author.name, request_count)
+    with _count_replies_lock:
+        # If enough time has elapsed, reset COUNT_REPLIES to an empty dict.
+        if time.time() - TIME_SINCE_RESET >= TIME_TO_RESET:
+            COUNT_REPLIES = {}
 
-    # Print a summary of the user's statistics.
-    logging.info("{0} has requested {1} fics with {2} remaining requests for the next {3} seconds.".format(
-        message.author.name, request_count, COUNT_REPLIES_LIMIT - COUNT_REPLIES[message.author.name],
-                                            TIME_TO_RESET - (time.time() - TIME_SINCE_RESET)))
+        # If the message author can not be found in the dict, add them.
+        COUNT_REPLIES.setdefault(message.author.name, request_count)
 
-    # Block the request if the user has exceeded their quota of replies.
-    if COUNT_REPLIES[message.author.name] + request_count > COUNT_REPLIES_LIMIT:
-        logging.error("{0} has exceeded their available replies.", message.author.name)
-        return
+        # Print a summary of the user's statistics.
+        logging.info("{0} has requested {1} fics with {2} remaining requests for the next {3} seconds.".format(
+            message.author.name, request_count, COUNT_REPLIES_LIMIT - COUNT_REPLIES[message.author.name],
+                                                TIME_TO_RESET - (time.time() - TIME_SINCE_RESET)))
+
+        # Block the request if the user has exceeded their quota of replies.
+        if COUNT_REPLIES[message.author.name] + request_count > COUNT_REPLIES_LIMIT:
+            logging.error("{0} has exceeded their available replies.", message.author.name)
+            return
 
-    # Otherwise, add the number of requests to the user's total number of requests.
-    COUNT_REPLIES[message.author.name] += request_count
+        # Otherwise, add the number of requests to the user's total number of requests.
+        COUNT_REPLIES[message.author.name] += request_count
 
-    # Print the current state of COUNT_REPLIES.
-    logging.debug("The current state of DM requests: {0}".format(COUNT_REPLIES))
+        # Print the current state of COUNT_REPLIES.
+        logging.debug("The current state of DM requests: {0}".format(COUNT_REPLIES))
 
     # Make the reply and return.
     make_reply(body, message, markers=markers, sub_recs=sub_recs)
@@ -250,8 +285,10 @@ def _refresh_get_comments_to_delete(obj_with_requests):
     if unfiltered_delete_list is None:
         return []
 
-    for comment in unfiltered_delete_list.list():
-        if comment.author is not None and comment.author.name == BOT_USERNAME:
+    # Our replies are direct children, so there is no need to walk
+    # (or expand) the whole comment tree.
+    for comment in unfiltered_delete_list:
+        if _is_bot_comment(comment):
             delete_list.append(comment)
     logging.info("Deleting bot comments: {0}".format(delete_list))
     return delete_list
@@ -306,17 +343,60 @@ def handle_comment(comment, extra_markers=set()):
         logging.error(e)
 
 
-def _single_submission_recommendations(submission_id):  # Get the full text for one submission
+# The number of fullnames reddit resolves in a single /api/info call.
+INFO_BATCH_SIZE = 100
+# The number of MoreComments we expand when looking for bot comments.
+MAX_MORE_COMMENTS = 8
+
+
+def _info(fullnames):
+    """Resolves the fullnames using as few requests as possible."""
+    for i in range(0, len(fullnames), INFO_BATCH_SIZE):
+        with metrics.REDDIT_TIME.timer(call="info"):
+            things = list(r.info(fullnames=fullnames[i:i + INFO_BATCH_SIZE]))
+        yield from things
+
+
+def _is_bot_comment(comment):
+    return is_comment(comment) and comment.author is not None and comment.author.name == BOT_USERNAME
+
+
+def _find_bot_comments(forest):
+    """
+    Returns the bot comments of the comment forest.
+
+    The collapsed parts of the forest are only expanded if the
+    loaded part does not contain any bot comments.
+    """
+    comments = forest.list()
+    found = [comment for comment in comments if _is_bot_comment(comment)]
+    if found or not any(isinstance(comment, MoreComments) for comment in comments):
+        return found
+
+    forest.replace_more(limit=MAX_MORE_COMMENTS)
+    return [comment for comment in forest.list() if _is_bot_comment(comment)]
+
+
+def _single_submission_recommendations(submission):  # Get the full text for one submission
+    # Return a list of the bodies of all bot comments in this submission.
+    with metrics.REDDIT_TIME.timer(call="comments"):
+        comments = _find_bot_comments(submission.comments)
+    return [comment.body for comment in comments]
+
+
+def _valid_recommendation_submissions(sub_ids):
+    """Looks up all submissions at once and drops the ones outside of our subreddits."""
+    subreddits = {subreddit.lower() for subreddit in SUBREDDIT_LIST}
+    submissions = []
     # Get the submission's subreddit. It must be a subreddit the bot runs on.
-    submission = r.submission(id=submission_id)
-    subreddit_name = submission.subreddit.display_name
-    if subreddit_name.lower() in [subreddit.lower() for subreddit in SUBREDDIT_LIST]:
-        # Return a list of all bot comments in this submission.
-        return [comment.body for comment in submission.comments.list()
-                if repliable(comment) and comment.author is not None and comment.author.name == BOT_USERNAME]
-    else:
-        logging.error("(Submission Rec.) Received request to parse invalid submission in /r/" + subreddit_name)
-        return []
+    fullnames = ["t3_" + sub_id for sub_id in OrderedDict.fromkeys(sub_ids)]
+    for submission in _info(fullnames):
+        subreddit_name = submission.subreddit.display_name
+        if subreddit_name.lower() in subreddits:
+            submissions.append(submission)
+        else:
+            logging.error("(Submission Rec.) Received request to parse invalid submission in /r/" + subreddit_name)
+    return submissions
 
 
 def get_submission_recommendations(request_body):
@@ -338,75 +418,58 @@ def get_submission_recommendations(request_body):
         sub_ids += [sub_id for sub_id in sub_request.split(';') if len(sub_id) == 6]
 
     logging.info("(Submission Rec.) Handling the following submission IDs: {0}".format(" ".join(sub_ids)))
-    replies = []  # A list of bot replies.
 
-    # We build replies[] by calling single_sub_reccomendations on every requested submission.
-    for sub_id in sub_ids:
+    # Threads that have been requested recently are already slimmed.
+    all_recommended_stories = []
+    uncached_ids = []
+    for sub_id in OrderedDict.fromkeys(sub_ids):
+        try:
+            # The persistent cache returns the records as lists.
+            all_recommended_stories += [
+                StoryRecord(*story) for story in default_cache.hit_cache("linksub", sub_id)]
+            logging.info("(Submission Rec.) Using cached submission ID: {0}".format(sub_id))
+        except (KeyError, TypeError):
+            uncached_ids.append(sub_id)
+
+    if not uncached_ids:
+        return all_recommended_stories
+
+    try:
+        submissions = _valid_recommendation_submissions(uncached_ids)
+    except Exception as e:
+        logging.error("(Submission Rec.) Failed to look up the submissions " + " ".join(uncached_ids))
+        logging.error(e)
+        return all_recommended_stories
+
+    def _fetch(submission):
         try:
-            reply = _single_submission_recommendations(sub_id)
-            replies.append("\n ".join(reply))
-            logging.info("(Submission Rec.) Handled submission ID: {0}".format(str(sub_id)))
+            reply = _single_submission_recommendations(submission)
+            logging.info("(Submission Rec.) Handled submission ID: {0}".format(submission.id))
         except Exception as e:
-            logging.error("(Submission Rec.) Failed to get sub recommendations for sub_id " + str(sub_id))
+            logging.error("(Submission Rec.) Failed to get sub recommendations for sub_id " + submission.id)
             logging.error(e)
+            return None
 
-    all_recommended_stories = []
-    for bot_comment in replies:
-        if 'p0ody-files' in bot_comment:  # Download site moved to new domain.
-            bot_comment = bot_comment.replace('p0ody-files', 'ff2ebook')
-            bot_comment = bot_comment.replace('ff_to_ebook', 'old')
-        all_recommended_stories += slimify_comment(bot_comment)
+        stories = [story for bot_comment in reply for story in slimify_comment(bot_comment)]
+        default_cache.push_cache("linksub", submission.id, stories)
+        return stories
+
+    # Fetch the comments of all submissions concurrently.
+    for stories in map_ordered(_fetch, submissions, lambda _: "reddit.com"):
+        if stories is not None:
+            all_recommended_stories += stories
     return all_recommended_stories
 
 
 def slimify_comment(bot_comment):
     """
     Slims down a bot comment into essential information: fic name, author, and description.
-    Returns a list of stories.
-    TODO: Find a less hacky way to do this.
+    Returns a list of StoryRecords.
     """
-    find_key = lambda slim_story: re.findall('(\[( |\S)+\) by)', slim_story)[0][0]
-    if 'slim!FanfictionBot' in bot_comment:
-        slimmed_stories = [story[0] for story in re.findall('((\n(.+)by(.+)(\s|\S)+?)\n+>( |\S)+\n)', bot_comment)]
-        slimmed_stories_dict = {}
-        for story in slimmed_stories:
-            try:
-                slimmed_stories_dict[find_key(story)] = story
-            except:
-                pass
-        slimmed_stories = slimmed_stories_dict
-    else:
-        all_metadata = re.findall('(\^(\s|\S)*?-{3})', bot_comment)  # Get metadata
-        titles_authors = re.findall('((\n(.+)by(.+))\n+>)', bot_comment)
-        titles_authors = [title_author[1] for title_author in titles_authors]
-        summaries = re.findall('(>(.*))\n+\^', bot_comment)
-        summaries = [summary[0] for summary in summaries]
-        wordcounts = re.findall('(Word(\D)+((\d{1,3})+(,|\d{1,3})+)+)', str(all_metadata))
-        wordcounts = [wordcount[2] for wordcount in wordcounts]
-        downloads = [re.findall(r"(\*Download\*([^\\]*))", str(story_metadata)) for story_metadata in all_metadata]
-        downloads_fixed = []  # Not all sites have downloads. We'll take care of this:
-        for download in downloads:
-            try:
-                downloads_fixed.append(download[0][0])
-            except:
-                downloads_fixed.append("No download available)")
-
-        slimmed_stories = {}
-        for i in range(len(all_metadata)):
-            complete = ''
-            if str(all_metadata[i]).__contains__('^*Status*: ^Complete'):
-                complete = ', complete'
-            story = '\n\n' + titles_authors[i]
-            story += ' (' + wordcounts[i] + ' words' + complete + '; ' + downloads_fixed[i] + ')'
-            story += '\n\n' + summaries[i] + '\n\n'
-            story = story.replace('\\n', '\n')
-            story = story.replace('---', '')
-            story = remove_superscript(story)
-            try:
-                slimmed_stories.update({find_key(story): story})
-            except:
-                pass
-    return list(slimmed_stories.values())
+    if 'p0ody-files' in bot_comment:  # Download site moved to new domain.
+        bot_comment = bot_comment.replace('p0ody-files', 'ff2ebook')
+        bot_comment = bot_comment.replace('ff_to_ebook', 'old')
+    return distinct_records(read_records(bot_comment))
 
 
 def is_comment(obj):
@@ -426,6 +489,16 @@ def is_message(obj):
     return isinstance(obj, praw.models.Message)
 
 
+def get_submission_id(obj):
+    """Returns the id of the thread the object belongs to."""
+    if is_submission(obj):
+        return obj.id
+    if is_comment(obj):
+        # link_id is the fullname of the submission. (t3_...)
+        return obj.link_id.split("_", 1)[-1]
+    return None
+
+
 def time_created(obj):
     return datetime.datetime.fromtimestamp(obj.created_utc)
 
@@ -456,80 +529,91 @@ def handle(obj, markers=set()):
 
 
 def valid_time(obj):
-    global MIN_VALID_TIME
     if not repliable(obj):
         return False
 
-    print('\n')
     obj_time = time_created(obj)
-    if obj_time > MIN_VALID_TIME:  # Check against cached time; update if necessary
-        MIN_VALID_TIME = last_comment_time()
-
-    if obj_time < MIN_VALID_TIME:
-        logging.warning("Object {0} creation time < min time ({1} < {2})".format(obj, obj_time, MIN_VALID_TIME))
+    min_valid_time = WATERMARK.value
+    if obj_time < min_valid_time:
+        logging.warning("Object %s creation time < min time (%s < %s)", obj, obj_time, min_valid_time)
         return False
-    logging.info("Object {0} creation time >= min time ({1} >= {2})".format(obj, obj_time, MIN_VALID_TIME))
+    logging.info("Object %s creation time >= min time (%s >= %s)", obj, obj_time, min_valid_time)
     return True
 
 
-def stream_handler(queue, iterator, handler):
-    def _raise(exc):
-        raise exc
+def post_text(obj):
+    """Returns the text of a comment, submission or message."""
+    if is_submission(obj):
+        return obj.selftext
+    return obj.body
 
-    try:
-        for post in iterator:
-            if post is not None and valid_time(post):
-                logging.info("Queueing Post: " + str(post))
-                queue.put_nowait((handler, post))
-    except BaseException as e:
-        # Send the actual exception to the main thread
-        queue.put_nowait((_raise, e))
 
+def should_handle(obj):
+    """Checks if a streamed post still has to be handled."""
+    if not repliable(obj):
+        return False
 
-def post_receiver(queue):
-    while True:
-        handler, post = queue.get()
-        handler(post)
+    # Drop posts without any request before doing anything expensive.
+    # The inbox is not filtered, as messages are always marked as read.
+    if not is_message(obj) and not might_contain_request(post_text(obj)):
+        return False
 
+    if obj.fullname in PROCESSED:
+        logging.info("Object %s has already been handled", obj)
+        return False
+    return valid_time(obj)
 
-def _make_thread(stream_type, multireddit, post_queue):
-    stream_types = {
-        "comments": r.subreddit(multireddit).stream.comments,
-        "submissions": r.subreddit(multireddit).stream.submissions,
-        "inbox": r.inbox.stream
-    }
 
-    return Thread(target=lambda: stream_handler(
-        post_queue,
-        stream_types[stream_type](pause_after=0),
-        handle))
+def accept_post(obj):
+    """Filters the streamed posts and holds the watermark for the accepted ones."""
+    if not should_handle(obj):
+        return False
+    # Queued posts are not done yet, so the watermark may not pass them.
+    if not DRY_RUN:
+        WATERMARK.hold(time_created(obj))
+    return True
 
 
-def stream_strategy():
-    post_queue = Queue()
-    threads = {}
-    multireddit = "+".join(SUBREDDIT_LIST)
-    stream_types = ["comments", "submissions", "inbox"]
+def finish_post(obj):
+    """Remembers a post once all of its replies are sent."""
+    # A dry run sends nothing, so it must not keep the next run from
+    # answering the post.
+    if not DRY_RUN:
+        PROCESSED.add(obj.fullname)
+        WATERMARK.release(time_created(obj))
 
-    def assign_thread(stream_type):
-        threads[stream_type] = _make_thread(stream_type, multireddit, post_queue)
-        threads[stream_type].daemon = True
-        threads[stream_type].start()
-        logging.info("(Stream Strategy) Began stream type: {0}".format(stream_type))
 
-    for stream_type in stream_types:
-        assign_thread(stream_type)
+def handle_post(obj):
+    """Handles a streamed post and remembers it."""
+    try:
+        handle(obj)
+    finally:
+        # The replies are still waiting in the outbox. Only remember
+        # the post once they are sent, so a restart does not lose them.
+        default_outbox.call_after(lambda: finish_post(obj))
 
-    while True:
-        try:
-            post_receiver(post_queue)
-        except Exception as e:
-            logging.error("(Stream Strategy) Exception below.")
-            bot_tools.print_exception(e)
-            for stream_type in stream_types:
-                if not threads[stream_type].isAlive():
-                    logging.error('(Stream Strategy) Restarting failed thread: {0}'.format(stream_type))
-                    assign_thread(stream_type)
+
+def stream_strategy():
+    engine = StreamEngine(handle_post, concurrency=CONCURRENCY)
+    multireddit = "+".join(SUBREDDIT_LIST)
+
+    engine.add_stream(
+        "comments",
+        lambda: r.subreddit(multireddit).stream.comments(pause_after=0),
+        filter=accept_post)
+    engine.add_stream(
+        "submissions",
+        lambda: r.subreddit(multireddit).stream.submissions(pause_after=0),
+        filter=accept_post)
+    # Direct messages get their own lane so they are not stuck
+    # behind busy subreddits.
+    engine.add_stream(
+        "inbox",
+        lambda: r.inbox.stream(pause_after=0),
+        priority=PRIORITY_HIGH,
+        filter=accept_post)
+
+    engine.run()
 
 
 def parse_submission_text(submission, markers):
@@ -553,12 +637,23 @@ def make_reply(body, obj, markers=None, additions=(), sub_recs=None):
     """Makes a reply for the given comment."""
     id = obj.id
 
+    def on_sent(reply):
+        # The slimmed recommendations of this thread are outdated now.
+        submission_id = get_submission_id(obj)
+        if submission_id is not None:
+            default_cache.invalidate("linksub", submission_id)
+
     def send_reply(message):
-        obj.reply(message)
-        bot_tools.pause(0, 10)
+        # The outbox paces the replies, so we can continue right away.
+        default_outbox.submit(obj, message, on_sent)
 
     try:
-        reply = list(formulate_reply(body, markers, additions))
+        if 'slim' in markers:
+            # Slim replies are rendered from the records of the stories.
+            stories = collect_stories(body, markers, additions)
+            reply = []
+        else:
+            reply = list(formulate_reply_parts(body, markers, additions))
     except StoryLimitExceeded:
         if not DRY_RUN:
             send_reply("You requested too many fics.\n"
@@ -568,45 +663,43 @@ def make_reply(body, obj, markers=None, additions=(), sub_recs=None):
 
     logging.info("Markers on reply to {0} consist of {1}".format(id, markers))
 
-    raw_reply = "".join(reply)
-    if 'slim' not in markers and len(raw_reply) > 0:
-        logging.info("Writing reply to {0} ({1} characters in {2} messages)".format(id, len(raw_reply), len(reply)))
+    if 'slim' not in markers and len(reply) > 0:
+        logging.info("Writing reply to {0} ({1} characters in {2} messages)".format(
+            id, sum(len(part) for part, _ in reply), len(reply)))
         # Do not send the comment.
         if not DRY_RUN:
-            for part in reply:
-                send_reply(part + FOOTER)
+            for part, records in reply:
+                send_reply(attach_payload(part, records, FOOTER))
 
-    elif 'slim' in markers and (len(raw_reply) > 0 or sum([len(rec) for rec in sub_recs]) > 0):
-        # This is CRITICAL until we find a cleaner way to do this. slim!FanfictionBot is to be used
-        # when parsing threads that already have slim stories.
+    elif 'slim' in markers and (stories or sub_recs):
+        # slim!FanfictionBot is used to recognize slim replies of older bot versions.
         slim_footer = "\n\n---\n\n*slim!{0}*^({1})".format(BOT_USERNAME, __version__)
-        slim_stories = []
+        slim_records = []
         # Submission recs (if they exist) are already slimmed.
-        if sub_recs is not None:
-            slim_stories += sub_recs
+        if sub_recs:
+            slim_records += sub_recs
             slim_footer += " Note that some story data has been sourced from older threads, and may be out of date."
-        slim_stories += slimify_comment(raw_reply)
+        slim_records += [
+            record for record in (story.get_record() for story in stories if isinstance(story, Story))
+            if record is not None]
 
         # Deal with any remaining duplicates.
-        find_key = lambda slim_story: re.findall('(\[( |\S)+\) by)', slim_story)[0][0]
-        slim_stories = list({find_key(story): story for story in slim_stories}.values())
+        slim_records = distinct_records(slim_records)
+        # Leave room for the payload, so old threads can be read without the regexes.
+        slim_stories = [
+            (render_slim(record), record, payload_share(record)) for record in slim_records]
+        limit = MAX_COMMENT_LENGTH - len(slim_footer) - PAYLOAD_OVERHEAD
 
-        total_character_count = sum([len(story) for story in slim_stories])
+        total_character_count = sum(len(story) for story, _, _ in slim_stories)
         logging.info("Writing reply to {0} ({1} characters in {2} messages)".format(
-            id, total_character_count, total_character_count / (10000 - len(slim_footer))
+            id, total_character_count, total_character_count / limit
         ))
 
-        current_reply = []
-        while len(slim_stories) != 0:  # We use slim_stories as a queue.
-            current_story = slim_stories.pop(0)
-            # Comments can be up to 10,000 characters:
-            if sum([len(story) for story in current_reply]) + len(current_story) > 10000 - len(slim_footer):
-                send_reply("".join(current_reply) + slim_footer)
-                current_reply = []
-            else:
-                current_reply += current_story
-        if len(current_reply) != 0:
-            send_reply("".join(current_reply) + slim_footer)
+        for chunk in pack(slim_stories, limit, length=lambda item: len(item[0]) + item[2]):
+            send_reply(attach_payload(
+                "".join(story for story, _, _ in chunk),
+                [record for _, record, _ in chunk],
+                slim_footer))
     else:
         logging.info("No reply conditions met.")
     logging.info('Continuing to parse submissions...')
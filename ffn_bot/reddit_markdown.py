@@ -1,9 +1,10 @@
 import re
 
-from bs4.dammit import EntitySubstitution
-
 linebreak = "---"
 
+# bs4 loads lxml, so the encoder is only created on first use.
+_encoder = None
+
 
 def bold(string):
     return '**' + string + '**'
@@ -28,8 +29,11 @@ def quote(string):
 
 
 def encode_url(string):
-    encoder = EntitySubstitution()
-    return encoder.substitute_html(string)
+    global _encoder
+    if _encoder is None:
+        from bs4.dammit import EntitySubstitution
+        _encoder = EntitySubstitution()
+    return _encoder.substitute_html(string)
 
 
 def escape(string):
@@ -1,12 +1,34 @@
+import collections
 import logging
 import re
-import traceback
+import time
 from collections import OrderedDict
 
-from ffn_bot import reddit_markdown
+from ffn_bot import metrics, reddit_markdown
+from ffn_bot.cache import default_cache
+from ffn_bot.titleindex import default_index
 
 WHITESPACE = re.compile("(|[ ]+(?!\Z))")
 
+# The essential data of a story. (Used by slim replies)
+StoryRecord = collections.namedtuple(
+    "StoryRecord",
+    "title author authorlink url words status download summary")
+
+
+def format_title_line(title, url, author, authorlink):
+    """Formats the "<title> by <author>" line of a story."""
+    return (
+        reddit_markdown.link(
+            reddit_markdown.bold(
+                reddit_markdown.italics(
+                    reddit_markdown.escape(title))),
+            reddit_markdown.encode_url(url)) + " by " +
+        reddit_markdown.link(
+            reddit_markdown.italics(
+                reddit_markdown.escape(author)),
+            reddit_markdown.encode_url(authorlink)))
+
 
 class StoryDoesNotExist(Exception):
     pass
@@ -21,14 +43,15 @@ class Site(object):
         """
         Sets the state of the site.
 
-        :param regex:  The regular expression that will be used
-                       to find the requests.
+        :param fname:  The command that will be used
+                       to find the requests. (e.g. linkffn)
         :param name:   The internal name of the site.
                        (Defaults to the class name.)
         """
         if name is None:
             # Automatically assign a name for the site.
             name = self.__class__.__module__ + "." + self.__class__.__name__
+        self.command = fname
         self.regex = re.compile(
             re.escape(fname) + r"\((.*?)\)",
             re.IGNORECASE
@@ -61,11 +84,20 @@ class Site(object):
 class Story(object):
     """
     Represents a single story.
+
+    Stories only keep the data they render, the parsed page is
+    dropped after parse_html.
     """
 
+    __slots__ = (
+        "context", "url", "title", "author", "authorlink", "summary", "stats",
+        "_loaded", "_load_error", "_rendered")
+
     def __init__(self, context=None):
         self.context = set() if context is None else context
         self._loaded = False
+        self._load_error = None
+        self._rendered = None
 
     def get_title(self):
         """Returns the title of the story"""
@@ -100,25 +132,23 @@ class Story(object):
         return self.stats
 
     def __str__(self):
+        """Returns the response string."""
+        if self._rendered is None:
+            with metrics.RENDER_TIME.timer(site=self._site_label()):
+                self._rendered = self.render()
+        return self._rendered
+
+    def render(self):
         """Generates the response string."""
         try:
             self.load()
-        except Exception as e:
-            logging.error("(STORY) Could not load story!")
-            logging.error(e)
-            traceback.print_exc()
+        except Exception:
+            logging.exception("(STORY) Could not load story!")
             return ("")
         result = ["\n\n"]
-        result.append(
-            reddit_markdown.link(
-                reddit_markdown.bold(
-                    reddit_markdown.italics(
-                        reddit_markdown.escape(self.get_title()))),
-                reddit_markdown.encode_url(self.get_url())) + " by " +
-            reddit_markdown.link(
-                reddit_markdown.italics(
-                    reddit_markdown.escape(self.get_author())),
-                reddit_markdown.encode_url(self.get_author_link())))
+        result.append(format_title_line(
+            self.get_title(), self.get_url(),
+            self.get_author(), self.get_author_link()))
         result.append("\n\n")
         result.extend(
             reddit_markdown.quote(
@@ -129,6 +159,42 @@ class Story(object):
 
         return "\n".join(result)
 
+    def get_record(self):
+        """
+        Returns the essential data of the story.
+
+        :returns: A StoryRecord or None if the story could not be loaded.
+        """
+        try:
+            self.load()
+        except Exception as e:
+            logging.error("(STORY) Could not load story!")
+            logging.error(e)
+            return None
+
+        stats = self.get_stats()
+        words = next(
+            (str(v) for k, v in stats.items() if str(k).startswith("Word")), None)
+        status = stats.get("Status")
+        if status is None:
+            status = self._completed_status(stats.get("Completed"))
+
+        return StoryRecord(
+            title=self.get_title(), author=self.get_author(),
+            authorlink=self.get_author_link(), url=self.get_url(),
+            words=words, status=status, download=self.get_download(),
+            summary=self.get_summary())
+
+    @staticmethod
+    def _completed_status(completed):
+        # AO3 gives the date the story was completed, HPFFA Yes or No.
+        if completed is None:
+            return None
+        completed = str(completed).strip()
+        if not completed or completed.lower() == "no":
+            return None
+        return "Complete"
+
     def format_stats(self):
         stats = OrderedDict()
         site = self.get_site()
@@ -172,9 +238,54 @@ class Story(object):
         return other.get_url() == self.get_url()
 
     def load(self):
+        # Do not try again if the story already failed to load.
+        if self._load_error is not None:
+            raise self._load_error
         if not self._loaded:
-            self.parse_html()
+            # Do not load stories again that were just found missing.
+            if default_cache.get_failure("story", self.get_url()) is not None:
+                self._load_error = StoryDoesNotExist()
+                raise self._load_error
+
+            start = time.perf_counter()
+            try:
+                # Only count the CPU time, not the time waiting for the page.
+                with metrics.PARSE_CPU.timer(clock=time.thread_time, site=self._site_label()):
+                    self.parse_html()
+            except Exception as e:
+                self._load_error = e
+                if isinstance(e, StoryDoesNotExist):
+                    default_cache.add_failure("story", self.get_url(), "does-not-exist")
+                    self._forget_title()
+                raise
+            finally:
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    url = self.get_url()
+                    logging.debug(
+                        "Loaded %s", url,
+                        extra={"site": self._site_label(), "url": url,
+                               "duration": time.perf_counter() - start, "failed": self._load_error is not None})
+            self._index_title()
         self._loaded = True
 
+    def _site_label(self):
+        # The name of the fetcher module. (e.g. ffn)
+        return type(self).__module__.rpartition(".")[2]
+
+    def _forget_title(self):
+        # The index might have led us here, so do not lead anyone else.
+        urls = {getattr(self, "url", None), self.get_url()}
+        try:
+            for url in urls - {None}:
+                default_index.forget(url)
+        except Exception:
+            logging.exception("(Title Index) Could not drop story")
+
+    def _index_title(self):
+        try:
+            default_index.add_story(self)
+        except Exception:
+            logging.exception("(Title Index) Could not index story")
+
     def parse_html(self):
         pass
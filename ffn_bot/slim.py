@@ -0,0 +1,224 @@
+"""
+Slim replies.
+
+Slim replies only contain the title, author, word count, status,
+download links and summary of each story. The stories are passed
+around as StoryRecords; every reply of the bot carries a hidden
+payload with its records, so they can be read back from old
+threads without parsing the markdown.
+"""
+import base64
+import json
+import logging
+import re
+import zlib
+
+from ffn_bot import reddit_markdown
+from ffn_bot.site import StoryRecord, format_title_line
+
+# The maximum length of a reddit comment.
+MAX_COMMENT_LENGTH = 10000
+
+# An empty link is not rendered by reddit.
+PAYLOAD_PREFIX = "[](#ffnbot-data:"
+PAYLOAD_SUFFIX = ")"
+PAYLOAD_OVERHEAD = len(PAYLOAD_PREFIX) + len(PAYLOAD_SUFFIX)
+
+# The fields stored in the payload. The summary is read from the
+# comment itself as it would double the size of the payload.
+PAYLOAD_FIELDS = ("title", "author", "authorlink", "url", "words", "status", "download")
+
+UNESCAPE_REGEX = re.compile(r"\\(.)")
+LEGACY_TITLE_LINE_REGEX = re.compile(r"\[(.*)\]\((.*?)\) by \[(.*?)\]\((.*?)\)")
+LEGACY_DOWNLOAD_REGEX = re.compile(r"\[EPUB\]\((.*?)\) or \[MOBI\]\((.*?)\)")
+LEGACY_WORDS_REGEX = re.compile(r"([\d,]+) words")
+
+
+def unescape(string):
+    """Reverts reddit_markdown.escape."""
+    return UNESCAPE_REGEX.sub(r"\1", string)
+
+
+def is_complete(record):
+    return record.status is not None and record.status.startswith("Complete")
+
+
+def render_slim(record):
+    """Renders the record as slim story."""
+    info = "%s words" % (record.words or "?")
+    if is_complete(record):
+        info += ", complete"
+    if record.download is not None:
+        info += "; *Download*: [EPUB]({0}) or [MOBI]({1})".format(*record.download)
+    else:
+        info += "; no download available"
+
+    return "".join((
+        "\n\n",
+        format_title_line(record.title, record.url, record.author, record.authorlink),
+        " (", info, ")\n\n",
+        reddit_markdown.quote(reddit_markdown.escape(record.summary)),
+        "\n\n"))
+
+
+def encode_payload(records):
+    """Encodes the records into a hidden markdown link."""
+    data = [[getattr(record, field) for field in PAYLOAD_FIELDS] for record in records]
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return (
+        PAYLOAD_PREFIX +
+        base64.urlsafe_b64encode(zlib.compress(raw, 9)).decode("ascii") +
+        PAYLOAD_SUFFIX)
+
+
+def payload_share(record):
+    """
+    Returns the space the record takes in a payload.
+
+    Records compress better together, so the shares of the records
+    add up to at least the length of their payload without the
+    PAYLOAD_OVERHEAD.
+    """
+    return len(encode_payload([record])) - PAYLOAD_OVERHEAD
+
+
+def attach_payload(text, records, footer):
+    """
+    Appends the payload of the records and the footer to the reply.
+
+    The payload is left out if the comment would become too long.
+    """
+    payload = encode_payload(records) if records else ""
+    if len(text) + len(payload) + len(footer) > MAX_COMMENT_LENGTH:
+        payload = ""
+    return text + payload + footer
+
+
+def _read_summary(bot_comment, url):
+    # The summary is the quote following the title line of the story.
+    start = bot_comment.find("](" + reddit_markdown.encode_url(url) + ")")
+    if start == -1:
+        return ""
+    start = bot_comment.find("\n>", start)
+    if start == -1:
+        return ""
+
+    lines = []
+    for line in bot_comment[start + 1:].split("\n"):
+        if not line.startswith(">"):
+            break
+        lines.append(line[2:] if line.startswith("> ") else line[1:])
+    return unescape("\n".join(lines))
+
+
+def decode_payload(bot_comment):
+    """
+    Reads the records from the payload of a bot comment.
+
+    :returns: A list of StoryRecords or None if there is no payload.
+    """
+    start = bot_comment.rfind(PAYLOAD_PREFIX)
+    if start == -1:
+        return None
+    start += len(PAYLOAD_PREFIX)
+    end = bot_comment.find(PAYLOAD_SUFFIX, start)
+    if end == -1:
+        return None
+
+    try:
+        data = json.loads(zlib.decompress(
+            base64.urlsafe_b64decode(bot_comment[start:end])).decode("utf-8"))
+    except (ValueError, zlib.error) as e:
+        logging.error("(Slim) Invalid payload: {0}".format(e))
+        return None
+
+    records = []
+    for item in data:
+        fields = dict(zip(PAYLOAD_FIELDS, item))
+        if fields["download"] is not None:
+            fields["download"] = tuple(fields["download"])
+        fields["summary"] = _read_summary(bot_comment, fields["url"])
+        records.append(StoryRecord(**fields))
+    return records
+
+
+def _legacy_record(title_line, words, complete, download, summary):
+    match = LEGACY_TITLE_LINE_REGEX.search(title_line)
+    if match is None:
+        return None
+    title, url, author, authorlink = match.groups()
+    # Titles are bold italics, authors italics.
+    if title.startswith("***") and title.endswith("***"):
+        title = title[3:-3]
+    if author.startswith("*") and author.endswith("*"):
+        author = author[1:-1]
+
+    download_match = LEGACY_DOWNLOAD_REGEX.search(download or "")
+    return StoryRecord(
+        title=unescape(title), author=unescape(author),
+        authorlink=authorlink, url=url, words=words,
+        status="Complete" if complete else None,
+        download=download_match.groups() if download_match else None,
+        summary=unescape(summary.lstrip(">").strip()))
+
+
+def _read_legacy_slim(bot_comment):
+    records = []
+    for story in re.findall('((\n(.+)by(.+)(\s|\S)+?)\n+>( |\S)+\n)', bot_comment):
+        story = story[0].strip("\n")
+        lines = story.split("\n")
+        words = LEGACY_WORDS_REGEX.search(lines[0])
+        summary = next((line for line in lines if line.startswith(">")), "")
+        records.append(_legacy_record(
+            lines[0], words.group(1) if words else None,
+            ", complete" in lines[0], lines[0], summary))
+    return records
+
+
+def _read_legacy_full(bot_comment):
+    all_metadata = re.findall('(\^(\s|\S)*?-{3})', bot_comment)  # Get metadata
+    titles_authors = re.findall('((\n(.+)by(.+))\n+>)', bot_comment)
+    titles_authors = [title_author[1] for title_author in titles_authors]
+    summaries = re.findall('(>(.*))\n+\^', bot_comment)
+    summaries = [summary[0] for summary in summaries]
+
+    records = []
+    for metadata, title_author, summary in zip(all_metadata, titles_authors, summaries):
+        metadata = reddit_markdown.remove_superscript(metadata[0])
+        words = re.search('Word\D+([\d,]+)', metadata)
+        download = re.search(r"\*Download\*[^\n]*", metadata)
+        records.append(_legacy_record(
+            title_author, words.group(1) if words else None,
+            "*Status*: Complete" in metadata,
+            download.group(0) if download else None, summary))
+    return records
+
+
+def read_records(bot_comment):
+    """
+    Reads the stories of a bot comment.
+
+    Comments without a payload are parsed from their markdown.
+
+    :returns: A list of StoryRecords.
+    """
+    records = decode_payload(bot_comment)
+    if records is not None:
+        return records
+
+    if 'slim!FanfictionBot' in bot_comment:
+        records = _read_legacy_slim(bot_comment)
+    else:
+        records = _read_legacy_full(bot_comment)
+    return [record for record in records if record is not None]
+
+
+def distinct_records(records):
+    """Removes duplicate stories while maintaining order."""
+    seen = set()
+    result = []
+    for record in records:
+        if record.url not in seen:
+            seen.add(record.url)
+            result.append(record)
+    return result
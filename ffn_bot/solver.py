@@ -0,0 +1,210 @@
+"""
+Client for the FlareSolverr endpoint we use to bypass cloudflare.
+"""
+import collections
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class SolverError(IOError):
+    """Raised when FlareSolverr could not load a page."""
+
+    def __init__(self, message, status=None):
+        super(SolverError, self).__init__(message)
+        # The http status the site answered with, if it answered.
+        self.status = status
+
+
+class FlareSolverrClient(object):
+    """
+    Pooled keep-alive client for FlareSolverr.
+
+    The client keeps one persistent solver session per domain, so
+    the cloudflare challenge is solved once per domain instead of
+    once per page.
+    """
+
+    def __init__(self, url="http://localhost:8191/v1", max_timeout=120000,
+                 pool_size=10, use_sessions=True):
+        self.url = url
+        self.max_timeout = max_timeout
+        self.use_sessions = use_sessions
+
+        # The http session is created on first use, so importing the
+        # bot does not have to import requests.
+        self._http = None
+        self._pool_size = pool_size
+
+        # Solver session ids by domain.
+        self.sessions = {}
+        self._session_lock = threading.Lock()
+
+        # Outcome counters and latency sums for the stats.
+        self.counters = collections.Counter()
+        self.latency = collections.Counter()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def http(self):
+        if self._http is None:
+            import requests
+            http = requests.Session()
+            http.headers["Content-Type"] = "application/json"
+            self._mount(http)
+            self._http = http
+        return self._http
+
+    def _mount(self, http):
+        from requests.adapters import HTTPAdapter
+        http.mount(self.url, HTTPAdapter(
+            pool_connections=1, pool_maxsize=self._pool_size))
+
+    def _command(self, cmd, **params):
+        params["cmd"] = cmd
+        # Allow the solver to use its full timeout before we give up.
+        response = self.http.post(
+            self.url, json=params,
+            timeout=(5, self.max_timeout / 1000 + 10))
+        content = response.json()
+        if content.get("status") != "ok":
+            raise SolverError(content.get("message", "Unknown solver error"))
+        return content
+
+    @staticmethod
+    def _domain(url):
+        return urlparse(url).netloc.lower()
+
+    def _get_session(self, domain):
+        if not self.use_sessions:
+            return None
+
+        session = self.sessions.get(domain)
+        if session is not None:
+            return session
+
+        import requests
+        with self._session_lock:
+            if domain in self.sessions:
+                return self.sessions[domain]
+
+            session = "ffnbot-" + domain
+            try:
+                self._command("sessions.create", session=session)
+            except SolverError as e:
+                # FlareSolverr refuses to create a session twice.
+                # That happens when the bot restarts.
+                if "already exists" not in str(e):
+                    logging.error("(Solver) Could not create session: {0}".format(e))
+                    return None
+            except requests.RequestException as e:
+                logging.error("(Solver) Could not create session: {0}".format(e))
+                return None
+
+            self._count(domain, "session_created")
+            self.sessions[domain] = session
+            return session
+
+    def _drop_session(self, domain):
+        with self._session_lock:
+            self.sessions.pop(domain, None)
+
+    def _count(self, domain, outcome, duration=None):
+        with self._stats_lock:
+            self.counters[outcome] += 1
+            self.counters[domain + ":" + outcome] += 1
+            if duration is not None:
+                self.latency[domain] += duration
+                self.latency[domain + ":count"] += 1
+
+    def get(self, url):
+        """
+        Loads the page using FlareSolverr.
+
+        :param url:  The url of the page.
+        :returns: The html of the page.
+        :raises: SolverError if the page could not be loaded.
+        """
+        import requests
+        domain = self._domain(url)
+        session = self._get_session(domain)
+
+        params = {"url": url, "maxTimeout": self.max_timeout}
+        if session is not None:
+            params["session"] = session
+
+        start = time.monotonic()
+        try:
+            content = self._command("request.get", **params)
+        except SolverError:
+            if session is None:
+                self._count(domain, "error", time.monotonic() - start)
+                raise
+            # The solver might have lost our session. (e.g. after a
+            # restart of the container) Retry once with a new one.
+            self._drop_session(domain)
+            session = self._get_session(domain)
+            if session is not None:
+                params["session"] = session
+            else:
+                params.pop("session", None)
+            try:
+                content = self._command("request.get", **params)
+            except (SolverError, requests.RequestException) as e:
+                self._count(domain, "error", time.monotonic() - start)
+                raise SolverError(str(e))
+        except requests.RequestException as e:
+            self._count(domain, "error", time.monotonic() - start)
+            raise SolverError(str(e))
+
+        # The solver reports "ok" for every page the site answered,
+        # including error, challenge and maintenance pages.
+        solution = content["solution"]
+        status = solution.get("status")
+        if status is not None and not 200 <= int(status) < 300:
+            self._count(domain, "http_error", time.monotonic() - start)
+            raise SolverError("{0} answered with status {1}".format(url, status), status=int(status))
+
+        self._count(domain, "ok", time.monotonic() - start)
+        return solution["response"]
+
+    def get_stats(self):
+        """Returns the counters and mean latency by domain."""
+        with self._stats_lock:
+            latency = {
+                key: self.latency[key] / self.latency[key + ":count"]
+                for key in self.latency
+                if not key.endswith(":count") and self.latency[key + ":count"]
+            }
+            return dict(self.counters), latency
+
+    def close(self):
+        """Destroys the solver sessions."""
+        if self._http is None:
+            return
+        import requests
+        with self._session_lock:
+            for session in self.sessions.values():
+                try:
+                    self._command("sessions.destroy", session=session)
+                except (SolverError, requests.RequestException):
+                    pass
+            self.sessions.clear()
+
+    def configure(self, section):
+        """
+        Configures the client using the [FlareSolverr]-section of the config file.
+
+        :param section:  The section of the config file.
+        """
+        url = section.get("url", self.url)
+        if url != self.url:
+            self.url = url
+            if self._http is not None:
+                self._mount(self._http)
+        self.max_timeout = int(section.get("max_timeout", self.max_timeout))
+        self.use_sessions = section.get("sessions", "true").lower() == "true"
+
+
+default_client = FlareSolverrClient()
@@ -1,3 +1,14 @@
+import collections
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from ffn_bot.bot_tools import safe_int
+from ffn_bot.cache import LimitedSizeDict
+
+
 class Application(object):
     """
     Singleton containing the current applications state.
@@ -18,3 +29,151 @@ class Application(object):
     def reset(cls):
         cls.STATE = None
         return cls()
+
+
+class Watermark(object):
+    """
+    The creation time of the newest post the bot is done with.
+
+    Posts created before this time have already been seen by the bot.
+    The watermark never passes a post that is still being handled, so
+    posts whose replies are lost on a restart are handled again. The
+    time is kept in memory and written to a file whenever it advances,
+    so it survives restarts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.timestamp = None
+        # Creation times of the posts that are still being handled.
+        self._held = collections.Counter()
+        # The newest creation time of the finished posts.
+        self._done = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Loads the watermark from its file.
+
+        :returns: True if a stored watermark has been found.
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            self.timestamp = safe_int(f.read().strip(), converter=float)
+        return self.timestamp is not None
+
+    @property
+    def value(self):
+        """The watermark as datetime."""
+        if self.timestamp is None:
+            return datetime.datetime.min
+        return datetime.datetime.fromtimestamp(self.timestamp)
+
+    def hold(self, value):
+        """
+        Keeps the watermark from passing a post until it is released.
+
+        :param value:  The creation time of the post as datetime.
+        """
+        with self._lock:
+            self._held[value.timestamp()] += 1
+
+    def release(self, value):
+        """
+        Marks a held post as done and advances past it if no older
+        post is still held.
+
+        :param value:  The creation time of the post as datetime.
+        """
+        timestamp = value.timestamp()
+        with self._lock:
+            self._held[timestamp] -= 1
+            if self._held[timestamp] <= 0:
+                del self._held[timestamp]
+            if self._done is None or timestamp > self._done:
+                self._done = timestamp
+            self._advance(self._done)
+
+    def advance(self, value):
+        """
+        Moves the watermark forward. Older values are ignored.
+
+        :param value:  A datetime.
+        """
+        if value == datetime.datetime.min:
+            return
+        with self._lock:
+            self._advance(value.timestamp())
+
+    def _advance(self, timestamp):
+        # Stop at the oldest held post, it is still valid at that time.
+        if self._held:
+            timestamp = min(timestamp, min(self._held))
+        if self.timestamp is not None and timestamp <= self.timestamp:
+            return
+        self.timestamp = timestamp
+        if self.path is not None:
+            # Replace the file atomically so a crash won't leave it empty.
+            with open(self.path + ".tmp", "w") as f:
+                f.write(repr(timestamp))
+            os.replace(self.path + ".tmp", self.path)
+
+
+class ProcessedStore(object):
+    """
+    Persistent set of the fullnames of all posts the bot has handled.
+
+    Recently added and looked up names are kept in memory, so the
+    database is only consulted for older posts. Only the newest
+    max_size posts are kept, older posts are behind the watermark.
+    """
+
+    # Prune the table every n writes.
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path=None, memory_size=10000, max_size=100000):
+        self.path = ":memory:" if path is None else path
+        self.max_size = max_size
+        self._writes = 0
+        self._recent = LimitedSizeDict(size_limit=memory_size)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS processed ("
+                "fullname TEXT PRIMARY KEY, time REAL NOT NULL"
+                ")")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS processed_time ON processed (time)")
+
+    def __contains__(self, fullname):
+        with self._lock:
+            if fullname in self._recent:
+                return True
+            found = self._connection.execute(
+                "SELECT 1 FROM processed WHERE fullname = ?",
+                (fullname,)).fetchone() is not None
+            if found:
+                self._recent[fullname] = True
+            return found
+
+    def add(self, fullname):
+        """Marks the post as handled."""
+        with self._lock, self._connection:
+            self._recent[fullname] = True
+            self._connection.execute(
+                "INSERT OR IGNORE INTO processed (fullname, time) VALUES (?, ?)",
+                (fullname, time.time()))
+            self._writes += 1
+            if self._writes % self.PRUNE_INTERVAL == 0:
+                self._prune()
+
+    def _prune(self):
+        # Drop the oldest posts if the table grew too large.
+        if self.max_size is None:
+            return
+        self._connection.execute(
+            "DELETE FROM processed WHERE fullname IN ("
+            "SELECT fullname FROM processed ORDER BY time DESC LIMIT -1 OFFSET ?"
+            ")", (self.max_size,))
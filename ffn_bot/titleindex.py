@@ -0,0 +1,154 @@
+"""
+Local index mapping story titles to their urls.
+
+Every title we resolved and every story page we parsed is added to
+the index, so repeated requests do not have to be googled again.
+Parsed pages never replace a known title, as titles are not unique,
+and entries expire like the searches they replace.
+"""
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from ffn_bot import metrics
+from ffn_bot.cache import default_cache, LimitedSizeDict, SQLiteStore
+
+NORMALIZE_REGEX = re.compile(r"[\W_]+")
+
+
+def normalize(title):
+    """
+    Normalizes the title so slightly different spellings of
+    the same title map to the same key.
+    """
+    return NORMALIZE_REGEX.sub("", title.casefold())
+
+
+def domain_of(url):
+    """Returns the domain of the url without the www-prefix."""
+    domain = urlparse(url).netloc.lower()
+    if domain.startswith("www."):
+        domain = domain[len("www."):]
+    return domain
+
+
+class TitleIndex(object):
+    """
+    Maps normalized titles and aliases of stories to their urls.
+    """
+
+    def __init__(self, store=None, max_size=50000):
+        self.index = LimitedSizeDict(size_limit=max_size)
+        self.store = store
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(domain, title):
+        return "%s:%s" % (domain, normalize(title))
+
+    def _fresh(self, t):
+        # Index entries expire like the searches they replace.
+        return time.time() - t <= default_cache.get_expire_time("search")
+
+    def lookup(self, domain, title):
+        """
+        Finds the url of the story.
+
+        :param domain:  The domain of the site.
+        :param title:   The title or an alias of the story.
+        :returns: The url or None if the title is unknown.
+        """
+        key = self._key(domain, title)
+        with self._lock:
+            if key in self.index:
+                url, t = self.index[key]
+                if self._fresh(t):
+                    return url
+                del self.index[key]
+
+        if self.store is None:
+            return None
+        result = self.store.get(key)
+        if result is None or not self._fresh(result[1]):
+            return None
+
+        with self._lock:
+            self.index[key] = result
+        return result[0]
+
+    def add(self, domain, title, url, replace=True):
+        """
+        Adds a title or an alias to the index.
+
+        :param domain:   The domain of the site.
+        :param title:    The title or an alias of the story.
+        :param url:      The url of the story.
+        :param replace:  Replace the url of a known title. Titles are not
+                         unique, so only searches should replace them.
+        """
+        if not title or not url or not normalize(title):
+            return
+        if not replace and self.lookup(domain, title) is not None:
+            return
+
+        key = self._key(domain, title)
+        t = time.time()
+        with self._lock:
+            self.index[key] = (url, t)
+        if self.store is not None:
+            self.store.set(key, url, t)
+
+    def add_story(self, story):
+        """Adds the title of a loaded story unless the title is known."""
+        url = story.get_url()
+        self.add(domain_of(url), story.get_title(), url, replace=False)
+
+    def forget(self, url):
+        """
+        Drops all titles pointing to the url.
+
+        :param url:  The url of a story that does not exist.
+        """
+        with self._lock:
+            keys = [key for key, (value, _) in self.index.items() if value == url]
+            for key in keys:
+                del self.index[key]
+        if self.store is not None:
+            self.store.delete_value(url)
+
+    def resolve(self, domain, title, query):
+        """
+        Finds the url of the story and falls back to a search.
+
+        :param domain:  The domain of the site.
+        :param title:   The requested title.
+        :param query:   The search query used if the title is unknown.
+        :returns: The url or None if the story could not be found.
+        """
+        url = self.lookup(domain, title)
+        if url is not None:
+            logging.debug("(Title Index) Resolved %s locally", title)
+            metrics.TITLE_INDEX.inc(result="hit")
+            return url
+
+        metrics.TITLE_INDEX.inc(result="miss")
+
+        url = default_cache.search(query)
+        if url is not None:
+            self.add(domain, title, url)
+        return url
+
+    def configure(self, section):
+        """
+        Configures the index using the [Cache]-section of the config file.
+
+        :param section:  The section of the config file.
+        """
+        path = section.get("path", "").strip()
+        if path:
+            self.store = SQLiteStore(path, table="titles")
+
+
+default_index = TitleIndex()